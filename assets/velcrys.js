@@ -0,0 +1,133 @@
+// Clientside callbacks of VelCrys
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    velcrys: {
+        // 6x6 Voigt matrix (GPa) of the elastic constants of the 3D plots, kept unchanged while
+        // any constant is empty or invalid so that the surfaces are computed once per tensor
+        triclinic: function(...c) {
+            if (c.some(x => typeof x !== 'number' || !isFinite(x))) {
+                return window.dash_clientside.no_update;
+            }
+            const C = [];
+            for (let i = 0, k = 0; i < 6; i++) {
+                C.push(new Array(6));
+                for (let j = i; j < 6; j++, k++) {
+                    C[i][j] = c[k];
+                }
+                for (let j = 0; j < i; j++) {
+                    C[i][j] = C[j][i];
+                }
+            }
+            return C;
+        },
+        cubic: function(c11, c12, c44) {
+            return window.dash_clientside.velcrys.triclinic(c11, c12, c12, 0.0, 0.0, 0.0,
+                                                          c11, c12, 0.0, 0.0, 0.0,
+                                                          c11, 0.0, 0.0, 0.0,
+                                                          c44, 0.0, 0.0,
+                                                          c44, 0.0,
+                                                          c44);
+        },
+        hexagonal: function(c11, c12, c13, c33, c44) {
+            return window.dash_clientside.velcrys.triclinic(c11, c12, c13, 0.0, 0.0, 0.0,
+                                                          c11, c13, 0.0, 0.0, 0.0,
+                                                          c33, 0.0, 0.0, 0.0,
+                                                          c44, 0.0, 0.0,
+                                                          c44, 0.0,
+                                                          0.5*(c11-c12));
+        },
+        // figure of a 3D plot with the hover values of the traces sent in the compact mode
+        // (compact() in velcrys.py) computed in the browser
+        figure: function(fig) {
+            if (!fig) {
+                return window.dash_clientside.no_update;
+            }
+            const velcrys = window.dash_clientside.velcrys;
+            const data = fig.data.map(trace => trace.meta && trace.meta.hover ? velcrys.hover(trace) : trace);
+            return Object.assign({}, fig, {data: data});
+        },
+        // figure of a 3D plot computed in two stages ({stage, figure}): the preview of the latest
+        // stage, and then the full surface of the same stage. The full surface of an older stage
+        // (a slower job finishing after a newer preview) is ignored
+        staged: function(full, preview) {
+            const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id);
+            if (!preview) {
+                return window.dash_clientside.no_update;
+            }
+            if (triggered.some(p => p.startsWith('figure'))) {
+                if (!full || full.stage !== preview.stage) {
+                    return window.dash_clientside.no_update;
+                }
+                return window.dash_clientside.velcrys.figure(full.figure);
+            }
+            return window.dash_clientside.velcrys.figure(preview.figure);
+        },
+        // customdata of the hover template from the surface: |v|, vx, vy, vz, n, θ, φ for the
+        // velocities (customdata = vx, vy, vz) and (v-v0)/v0, n, θ, φ for the fractional changes
+        // (radius 1+s*(v-v0)/v0). The x, y and z arrays of a Surface are the transposed θ-φ grid
+        hover: function(trace) {
+            const velcrys = window.dash_clientside.velcrys;
+            const x = velcrys.decode(trace.x), y = velcrys.decode(trace.y), z = velcrys.decode(trace.z);
+            const color = velcrys.decode(trace.type === 'surface' ? trace.surfacecolor : trace.intensity);
+            const c = trace.customdata === undefined ? null : velcrys.decode(trace.customdata);
+            const s = trace.meta.scale, deg = 180.0/Math.PI;
+            const point = function(p, g) {
+                const r = Math.hypot(x[g], y[g], z[g])*(c || 1.0 + s*color[g] >= 0.0 ? 1.0 : -1.0);
+                const nx = x[g]/r, ny = y[g]/r, nz = z[g]/r;
+                const phi = Math.atan2(ny, nx);
+                const n = [nx, ny, nz, Math.atan2(Math.hypot(nx, ny), nz)*deg,
+                           (phi < 0.0 ? phi + 2.0*Math.PI : phi)*deg];
+                return (c ? [Math.hypot(c[3*p], c[3*p+1], c[3*p+2]), c[3*p], c[3*p+1], c[3*p+2]] : [color[g]]).concat(n);
+            };
+            let customdata;
+            if (trace.type === 'surface') {
+                const m = Math.round(Math.sqrt(x.length));
+                customdata = [];
+                for (let i = 0; i < m; i++) {
+                    const row = [];
+                    for (let j = 0; j < m; j++) {
+                        row.push(point(i*m + j, j*m + i));
+                    }
+                    customdata.push(row);
+                }
+            } else {
+                customdata = Array.from(x, (_, k) => point(k, k));
+            }
+            return Object.assign({}, trace, {customdata: customdata});
+        },
+        // flat typed array of a figure array, either plain or binary {dtype, bdata, shape}
+        decode: function(a) {
+            if (a.bdata === undefined) {
+                return Float64Array.from(a.flat(Infinity));
+            }
+            const types = {f8: Float64Array, f4: Float32Array, i4: Int32Array, u4: Uint32Array,
+                           i2: Int16Array, u2: Uint16Array, i1: Int8Array, u1: Uint8Array};
+            const b = atob(a.bdata), bytes = new Uint8Array(b.length);
+            for (let i = 0; i < b.length; i++) {
+                bytes[i] = b.charCodeAt(i);
+            }
+            return new types[a.dtype](bytes.buffer);
+        },
+        // component tree of the selected type of calculation, downloaded once from the static
+        // JSON files served by velcrys.py (LAYOUTS) and reused on the next changes of the mode. The
+        // Promise returned is resolved by the Dash renderer (dash>=3.0.0, see requirements.txt)
+        layout: function(mode, url) {
+            if (!mode) {
+                return null;
+            }
+            const layouts = window.dash_clientside.velcrys.layouts;
+            if (!layouts.has(url + mode)) {
+                layouts.set(url + mode, fetch(url + mode + '.json').then(r => {
+                    if (!r.ok) {
+                        layouts.delete(url + mode);
+                        throw new Error('layout ' + mode + ': HTTP ' + r.status);
+                    }
+                    return r.text();
+                }));
+            }
+            // new tree every time, the renderer keeps its own state of the inputs
+            return layouts.get(url + mode).then(JSON.parse);
+        },
+        layouts: new Map(),
+    },
+});
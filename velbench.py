@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# Benchmarks of VelCrys: the kernels of velcore.py (vel() per call, unaryCubicEquation, the batched
+# Christoffel solver, the minimize() equilibrium of enecub/enehex and the dCij of a field sweep)
+# and the end-to-end 3D plots of velcrys.py (surface, figure and JSON payload of update_tric3d,
+# update_cf and update_hf) at several numbers of wave vectors N, for a cubic, a hexagonal and a
+# triclinic crystal. Every run is saved as a JSON file and compared with the previous runs of the
+# same machine, so that a slower NumPy, SciPy, Dash or Plotly release or a code change shows up as
+# a regression
+#
+#   python3 velbench.py [-k FILTER] [--quick] [-o DIR] [--compare FILE] [--threshold 0.2]
+
+import os
+import sys
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import json
+import platform
+import subprocess
+import timeit
+
+# the on-disk cache of the surfaces would time file reads instead of computations
+os.environ['VELCRYS_CACHE_SIZE'] = '0'
+
+import numpy as np
+import scipy
+from scipy.optimize import minimize
+
+import velcore
+
+
+# representative crystals: elastic constants (GPa) and mass density (kg/m^3) of bcc Fe, hcp Co and
+# a triclinic tensor without any symmetry, and magnetic parameters of the field plots (same units as
+# the web application)
+TENSORS = {
+  'cubic': (velcore.cubic_stiffness(230.0, 135.0, 117.0), 7874.0),
+  'hexagonal': (velcore.hexagonal_stiffness(307.0, 165.0, 103.0, 358.0, 75.5), 8900.0),
+  'triclinic': (np.array([[250.0, 110.0, 90.0, 5.0, -3.0, 2.0],
+                          [110.0, 240.0, 100.0, 1.0, 4.0, -2.0],
+                          [90.0, 100.0, 300.0, 3.0, 2.0, 1.0],
+                          [5.0, 1.0, 3.0, 80.0, 1.0, 2.0],
+                          [-3.0, 4.0, 2.0, 1.0, 70.0, 3.0],
+                          [2.0, -2.0, 1.0, 2.0, 3.0, 90.0]])*10**9, 7000.0),
+}
+
+# mu0 Ms, mu0 H (T), K1, K2 (MJ/m^3), magnetoelastic constants (MPa)
+MAGNETIC = {
+  'cubic': dict(ms=2.1, kk1=0.048, kk2=0.0, bb1=-2.9, bb2=6.4, hx=0.3, hy=0.2, hz=1.0),
+  'hexagonal': dict(ms=1.8, kk1=0.41, kk2=0.15, bb21=-8.1, bb22=-29.4, bb3=28.2, bb4=29.4, hx=0.3, hy=0.2, hz=1.0),
+}
+
+SIZES = [2000, 20000, 200000]
+QUICK = [2000]
+
+
+def measure(func, repeat=5, target=0.2):
+  # seconds per call of func: minimum and median of repeat timings of a number of calls lasting
+  # about target seconds (at least one call)
+  timer = timeit.Timer(func)
+  number = 1
+  while True:
+    t = timer.timeit(number)
+    if t >= target or number >= 1 << 20:
+      break
+    number = max(number*2, int(number*target/max(t, 1e-9)))
+  times = [t/number] + [timer.timeit(number)/number for _ in range(repeat-1)]
+  return dict(min=min(times), median=float(np.median(times)), number=number, repeat=repeat)
+
+
+def cold(func):
+  # runs func without the in-process caches of the meshes and fractional changes of velcore
+  def run():
+    for cached in (velcore.fibonacci_sphere, velcore.adaptive_sphere, velcore.fractional_change):
+      cached.cache_clear()
+    return func()
+  return run
+
+
+def directions(m, seed=0):
+  N = np.random.default_rng(seed).normal(size=(m, 3))
+  return N/np.linalg.norm(N, axis=1)[:, None]
+
+
+def kernels():
+  # (name, function, calls) of the kernels, timed per call
+  N = directions(1000)
+
+  for name, (C, rho) in TENSORS.items():
+    A = velcore.voigt21(C)/rho
+    for sol in velcore.SOLS:
+      def run(A=A, sol=sol):
+        for n in N[:100]:
+          velcore.vel(*A, *n, sol)
+      yield 'vel[%s,%s]' % (name, sol), run, 100
+
+    bb, cc, dd = velcore.christoffel(*A, *N.T)[:3]
+    def run(bb=bb, cc=cc, dd=dd):
+      for b, c, d in zip(bb[:100], cc[:100], dd[:100]):
+        velcore.unaryCubicEquation(b, c, d)
+    yield 'unaryCubicEquation[%s]' % name, run, 100
+
+    yield 'cubic_batch[%s,M=1000]' % name, lambda bb=bb, cc=cc, dd=dd: velcore.cubic_batch(bb, cc, dd), 1
+    yield 'vel_batch_all[%s,M=1000]' % name, lambda A=A: velcore.vel_batch_all(A, N), 1
+
+  mu0 = 4.0*np.pi*10.0**(-7)
+  for name, energy in (('cubic', velcore.enecub), ('hexagonal', velcore.enehex)):
+    p = MAGNETIC[name]
+    a = [p['hx'], p['hy'], p['hz'], p['ms']/mu0, p['kk1']*10.0**6, p['kk2']*10.0**6]
+    # same options as magnetic_cubic() and magnetic_hex(), without the convergence message
+    options = {'maxiter': 1000, 'maxfev': 1000, 'disp': False, 'xatol': 0.0000001}
+    yield 'minimize[%s]' % energy.__name__, lambda energy=energy, a=a: minimize(energy, np.array([0.2, 0.3]), args=(a),
+                                                                               method='Nelder-Mead', options=options), 1
+
+  # dCij of a sweep of 1000 fields (100 equilibria repeated 10 times) from their equilibrium angles
+  H = directions(100)*np.linspace(0.01, 3.0, 100)[:, None]
+  for name, energy, batch in (('cubic', velcore.enecub, velcore.magnetic_cubic_batch),
+                              ('hexagonal', velcore.enehex, velcore.magnetic_hex_batch)):
+    p = {k: v for k, v in MAGNETIC[name].items() if k not in ('hx', 'hy', 'hz')}
+    theta, phi = velcore.equilibrium(energy, H, p['ms'], p['kk1'], p['kk2'])
+    args = np.tile(theta, 10), np.tile(phi, 10), np.tile(H, (10, 1))
+    yield '%s[M=1000]' % batch.__name__, lambda batch=batch, args=args, p=p: batch(*args, **p), 1
+
+
+def callbacks(sizes):
+  # (name, function) of the end-to-end 3D plots: the computations of the callbacks, the
+  # plotly figure and its JSON payload as sent by Dash, without the in-process caches
+  import velcrys
+  from plotly.io.json import to_json_plotly
+
+  for name, (C, rho) in TENSORS.items():
+    C = (C/10**9).tolist()
+    for mesh in ('grid', 'fibonacci'):
+      for nn in sizes:
+        def run(C=C, rho=rho, nn=nn, mesh=mesh):
+          return to_json_plotly(velcrys.tric3d_figure(C, rho, nn, 'sol_1', mesh, 'compact'))
+        yield 'update_tric3d[%s,%s,N=%d]' % (name, mesh, nn), cold(run)
+
+  for mode, name, change, figure in (('cf', 'cubic', velcrys.cf_change, velcrys.update_cf_figure),
+                                     ('hf', 'hexagonal', velcrys.hf_change, velcrys.update_hf_figure)):
+    C, rho = TENSORS[name]
+    C = (C/10**9).tolist()
+    for mesh in ('grid', 'fibonacci'):
+      for nn in sizes:
+        def run(C=C, rho=rho, nn=nn, mesh=mesh, change=change, figure=figure, p=MAGNETIC[name]):
+          v000 = velcrys.kept('velbench', change, [C, *p.values(), rho, nn, 'sol_1', mesh])
+          return to_json_plotly(figure(v000, v000, 1.0, 'compact'))
+        yield 'update_%s[%s,%s,N=%d]' % (mode, name, mesh, nn), cold(run)
+
+
+def environment():
+  import dash
+  import plotly
+  try:
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True).stdout.strip() or None
+  except OSError:
+    commit = None
+  return dict(machine=platform.node(), platform=platform.platform(), processor=platform.processor(),
+              cpus=os.cpu_count(), python=platform.python_version(), numpy=np.__version__, scipy=scipy.__version__,
+              dash=dash.__version__, plotly=plotly.__version__, commit=commit)
+
+
+def previous(outdir, machine):
+  # latest result of every benchmark in the result files of the machine in outdir
+  runs = []
+  for path in glob.glob(os.path.join(outdir, '*.json')):
+    try:
+      with open(path) as f:
+        run = json.load(f)
+    except (OSError, ValueError):
+      continue
+    if run.get('environment', {}).get('machine') == machine:
+      runs.append((run['created'], path, run))
+  results = {}
+  for created, path, run in sorted(runs, key=lambda r: r[:2]):
+    results.update({name: dict(res, run=os.path.basename(path)) for name, res in run['results'].items()})
+  return results
+
+
+def main(argv=None):
+
+  parser = argparse.ArgumentParser(prog='velbench', description='Benchmarks of the VelCrys kernels and 3D plots')
+  parser.add_argument('-k', '--filter', default='', help='run only the benchmarks whose name contains FILTER')
+  parser.add_argument('--quick', action='store_true', help='only N=%s for the 3D plots' % QUICK[0])
+  parser.add_argument('-o', '--outdir', default='velbench-results', help='directory of the result files (default: velbench-results)')
+  parser.add_argument('--compare', help='result file to compare with (default: latest results of this machine in OUTDIR)')
+  parser.add_argument('--threshold', type=float, default=0.2, help='slowdown reported as a regression (default: 0.2, i.e. 20%%)')
+  parser.add_argument('--no-save', action='store_true', help='do not save the results')
+  args = parser.parse_args(argv)
+
+  env = environment()
+  if args.compare:
+    with open(args.compare) as f:
+      base = json.load(f)['results']
+  else:
+    base = previous(args.outdir, env['machine'])
+
+  results = {}
+
+  def report(name, res):
+    results[name] = res
+    line = '%-48s %12.6g s' % (name, res['min'])
+    if 'bytes' in res:
+      line += ' %10d B' % res['bytes']
+    old = base.get(name)
+    if old:
+      ratio = res['min']/old['min']
+      line += '  x%.2f' % ratio
+      if ratio > 1.0 + args.threshold:
+        line += '  REGRESSION'
+    print(line, flush=True)
+
+  # the callbacks and minimize() print the convergence message of Nelder-Mead
+  quiet = contextlib.redirect_stdout(io.StringIO())
+
+  for name, func, calls in kernels():
+    if args.filter in name:
+      res = measure(func)
+      res.update(min=res['min']/calls, median=res['median']/calls)
+      report(name, res)
+
+  for name, func in callbacks(QUICK if args.quick else SIZES):
+    if args.filter in name:
+      with quiet:
+        payload = len(func())
+        res = measure(func, repeat=3, target=0.0)
+      res['bytes'] = payload
+      report(name, res)
+
+  run = dict(created=datetime.datetime.now().isoformat(timespec='seconds'), environment=env, results=results)
+
+  regressions = [name for name in results if name in base and results[name]['min'] > (1.0 + args.threshold)*base[name]['min']]
+  if regressions:
+    print('%d regressions (slower by more than %d%%):' % (len(regressions), round(100*args.threshold)))
+    for name in regressions:
+      print('  %s, previous result in %s' % (name, base[name].get('run', args.compare)))
+
+  if not args.no_save:
+    os.makedirs(args.outdir, exist_ok=True)
+    path = os.path.join(args.outdir, '%s-%s.json' % (run['created'].replace(':', ''), env['commit'] or 'local'))
+    with open(path, 'w') as f:
+      json.dump(run, f, indent=1)
+    print('saved %s' % path)
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
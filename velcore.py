@@ -0,0 +1,1524 @@
+# -*- coding: utf-8 -*-
+
+# Headless computational core of VelCrys: group velocities, magnetoelastic corrections to the
+# elastic tensor and the fractional change of the sound velocity, with no Dash or Plotly import.
+# The web application (velcrys.py) is built on top of it. Batch computations of many elastic
+# tensors can be run from the command line with
+#
+#   python3 velcrys.py batch tensors.txt [directions.txt] [-n N] [-o velcrys.npz]
+#   python3 velcrys.py screen tensors.txt [-o OUTDIR] [-j WORKERS]
+#   python3 velcrys.py surface tensors.txt [-i INDEX] [--mode qP] [-o surface.vcs]
+
+import os
+import sys
+import argparse
+import contextlib
+import concurrent.futures
+import functools
+import glob
+import hashlib
+import json
+import tempfile
+import threading
+import time
+import numpy as np
+import cmath
+
+
+def christoffel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,n1,n2,n3):
+  
+  g11=a11*n1*n1+2.0*a16*n1*n2+2.0*a15*n1*n3+a66*n2*n2+2.0*a56*n2*n3+a55*n3*n3
+  g12=a16*n1*n1+(a12+a66)*n1*n2+(a14+a56)*n1*n3+a26*n2*n2+(a25+a46)*n2*n3+a45*n3*n3
+  g13=a15*n1*n1+(a14+a56)*n1*n2+(a13+a55)*n1*n3+a46*n2*n2+(a36+a45)*n2*n3+a35*n3*n3
+  g22=a66*n1*n1+2.0*a26*n1*n2+2.0*a46*n1*n3+a22*n2*n2+2.0*a24*n2*n3+a44*n3*n3
+  g23=a56*n1*n1+(a25+a46)*n1*n2+(a36+a45)*n1*n3+a24*n2*n2+(a23+a44)*n2*n3+a34*n3*n3
+  g33=a55*n1*n1+2.0*a45*n1*n2+2.0*a35*n1*n3+a44*n2*n2+2.0*a34*n2*n3+a33*n3*n3
+
+  bb=-(g11+g22+g33)
+  cc=g11*g33+g22*g33+g11*g22-g12**2-g13**2-g23**2
+  dd=g23**2*g11+g13**2*g22+g12**2*g33-g11*g22*g33-2.0*g12*g13*g23
+
+
+#  p=g11+g22+g33
+#  q=g11*g22-g12**2+g22*g33-g23**2+g11*g33-g13**2
+#  detg=g11*(g22*g33-g23**2)-g12*(g12*g33-g23*g13)+g13*(g12*g23-g22*g13)
+#  r=np.sqrt(-(1.0/27.0)*(q-((p**2)/3.0))**3)
+
+
+  dbdn1= -2.0*a11*n1 - 2.0*a15*n3 - 2.0*a16*n2 - 2.0*a26*n2 - 2.0*a35*n3 - 2.0*a45*n2 - 2.0*a46*n3 - 2.0*a55*n1 - 2.0*a66*n1
+  dbdn2= -2.0*a16*n1 - 2.0*a22*n2 - 2.0*a24*n3 - 2.0*a26*n1 - 2.0*a34*n3 - 2.0*a44*n2 - 2.0*a45*n1 - 2.0*a56*n3 - 2.0*a66*n2
+  dbdn3= -2.0*a15*n1 - 2.0*a24*n2 - 2.0*a33*n3 - 2.0*a34*n2 - 2.0*a35*n1 - 2.0*a44*n3 - 2.0*a46*n1 - 2.0*a55*n3 - 2.0*a56*n2
+
+
+  dcdn1= (2*a11*n1 + 2.0*a15*n3 + 2.0*a16*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2*a11*n1 + 2.0*a15*n3 + 2.0*a16*n2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) - (4*a15*n1 + 2*n2*(a14 + a56) + 2*n3*(a13 + a55))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45)) - (4*a16*n1 + 2*n2*(a12 + a66) + 2*n3*(a14 + a56))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46)) + (2.0*a26*n2 + 2.0*a46*n3 + 2*a66*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2.0*a26*n2 + 2.0*a46*n3 + 2*a66*n1)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a35*n3 + 2.0*a45*n2 + 2*a55*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2.0*a35*n3 + 2.0*a45*n2 + 2*a55*n1)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) - (4*a56*n1 + 2*n2*(a25 + a46) + 2*n3*(a36 + a45))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))
+
+  dcdn2= (2.0*a16*n1 + 2.0*a56*n3 + 2*a66*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2.0*a16*n1 + 2.0*a56*n3 + 2*a66*n2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2*a22*n2 + 2.0*a24*n3 + 2.0*a26*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2*a22*n2 + 2.0*a24*n3 + 2.0*a26*n1)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) - (4*a24*n2 + 2*n1*(a25 + a46) + 2*n3*(a23 + a44))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) - (4*a26*n2 + 2*n1*(a12 + a66) + 2*n3*(a25 + a46))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46)) + (2.0*a34*n3 + 2*a44*n2 + 2.0*a45*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2.0*a34*n3 + 2*a44*n2 + 2.0*a45*n1)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) - (4*a46*n2 + 2*n1*(a14 + a56) + 2*n3*(a36 + a45))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))
+
+  dcdn3= (2.0*a15*n1 + 2*a55*n3 + 2.0*a56*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2.0*a15*n1 + 2*a55*n3 + 2.0*a56*n2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a24*n2 + 2*a44*n3 + 2.0*a46*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2.0*a24*n2 + 2*a44*n3 + 2.0*a46*n1)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2*a33*n3 + 2.0*a34*n2 + 2.0*a35*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2*a33*n3 + 2.0*a34*n2 + 2.0*a35*n1)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) - (4*a34*n3 + 2*n1*(a36 + a45) + 2*n2*(a23 + a44))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) - (4*a35*n3 + 2*n1*(a13 + a55) + 2*n2*(a36 + a45))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45)) - (4*a45*n3 + 2*n1*(a14 + a56) + 2*n2*(a25 + a46))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))
+
+  dddn1= (-2*a11*n1 - 2.0*a15*n3 - 2.0*a16*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2*a11*n1 + 2.0*a15*n3 + 2.0*a16*n2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))**2 + (-2*a15*n1 - n2*(a14 + a56) - n3*(a13 + a55))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4*a15*n1 + 2*n2*(a14 + a56) + 2*n3*(a13 + a55))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (4*a16*n1 + 2*n2*(a12 + a66) + 2*n3*(a14 + a56))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (4.0*a16*n1 + 2.0*n2*(a12 + a66) + 2.0*n3*(a14 + a56))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (2.0*a26*n2 + 2.0*a46*n3 + 2*a66*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a26*n2 + 2.0*a46*n3 + 2*a66*n1)*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))**2 + (2.0*a35*n3 + 2.0*a45*n2 + 2*a55*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2.0*a35*n3 + 2.0*a45*n2 + 2*a55*n1)*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))**2 + (2*a56*n1 + n2*(a25 + a46) + n3*(a36 + a45))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46)) + (4*a56*n1 + 2*n2*(a25 + a46) + 2*n3*(a36 + a45))*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))
+
+  dddn2= (-2.0*a16*n1 - 2.0*a56*n3 - 2*a66*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a16*n1 + 2.0*a56*n3 + 2*a66*n2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))**2 + (2*a22*n2 + 2.0*a24*n3 + 2.0*a26*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2*a22*n2 + 2.0*a24*n3 + 2.0*a26*n1)*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))**2 + (2*a24*n2 + n1*(a25 + a46) + n3*(a23 + a44))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46)) + (4*a24*n2 + 2*n1*(a25 + a46) + 2*n3*(a23 + a44))*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4.0*a26*n2 + 2.0*n1*(a12 + a66) + 2.0*n3*(a25 + a46))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4*a26*n2 + 2*n1*(a12 + a66) + 2*n3*(a25 + a46))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a34*n3 + 2*a44*n2 + 2.0*a45*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2.0*a34*n3 + 2*a44*n2 + 2.0*a45*n1)*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))**2 + (-2*a46*n2 - n1*(a14 + a56) - n3*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4*a46*n2 + 2*n1*(a14 + a56) + 2*n3*(a36 + a45))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2)
+
+  dddn3= (-2.0*a15*n1 - 2*a55*n3 - 2.0*a56*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a15*n1 + 2*a55*n3 + 2.0*a56*n2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))**2 + (2.0*a24*n2 + 2*a44*n3 + 2.0*a46*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a24*n2 + 2*a44*n3 + 2.0*a46*n1)*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))**2 + (2*a33*n3 + 2.0*a34*n2 + 2.0*a35*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2*a33*n3 + 2.0*a34*n2 + 2.0*a35*n1)*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))**2 + (2*a34*n3 + n1*(a36 + a45) + n2*(a23 + a44))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46)) + (4*a34*n3 + 2*n1*(a36 + a45) + 2*n2*(a23 + a44))*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (-2*a35*n3 - n1*(a13 + a55) - n2*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4*a35*n3 + 2*n1*(a13 + a55) + 2*n2*(a36 + a45))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (4*a45*n3 + 2*n1*(a14 + a56) + 2*n2*(a25 + a46))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (4.0*a45*n3 + 2.0*n1*(a14 + a56) + 2.0*n2*(a25 + a46))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))
+
+
+  return bb,cc,dd,dbdn1,dbdn2,dbdn3,dcdn1,dcdn2,dcdn3,dddn1,dddn2,dddn3
+
+def vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,n1,n2,n3,sol):
+  
+  bb,cc,dd,dbdn1,dbdn2,dbdn3,dcdn1,dcdn2,dcdn3,dddn1,dddn2,dddn3 = christoffel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,n1,n2,n3)
+
+  c2 = unaryCubicEquation(bb, cc, dd)
+  
+  c2 = np.array(c2)
+  c4 = c2 * c2
+  pv = np.sqrt(c2)
+  EPS = 10**-7
+
+  if np.abs(pv[1] - pv[2]) < EPS:
+    nRoot = 2
+    if np.abs(pv[0] - pv[2]) < EPS:
+      nRoot = 1
+  else:
+    nRoot = 3
+      
+  if nRoot == 1:
+    g = 6.0 * pv 
+    vx=-dbdn1/g[0]
+    vy=-dbdn2/g[0]
+    vz=-dbdn3/g[0]
+    
+  elif nRoot == 2:
+    g = np.array([2.0 * pv[0] * (3.0 * c4[0] + 2.0 * bb * c2[0] + cc),
+                      4.0 * pv[1] * (3.0 * c2[1] + bb),
+                      4.0 * pv[2] * (3.0 * c2[2] + bb)])
+    if sol == 'sol_1':
+      vx=-(c4[0] * dbdn1 + c2[0] * dcdn1 + dddn1) / g[0]
+      vy=-(c4[0] * dbdn2 + c2[0] * dcdn2 + dddn2) / g[0]
+      vz=-(c4[0] * dbdn3 + c2[0] * dcdn3 + dddn3) / g[0]
+      
+    elif sol == 'sol_2':
+      vx=-(2.0 * c2[1] * dbdn1 + dcdn1) / g[1]
+      vy=-(2.0 * c2[1] * dbdn2 + dcdn2) / g[1]
+      vz=-(2.0 * c2[1] * dbdn3 + dcdn3) / g[1]
+    
+    elif sol == 'sol_3':
+      vx=-(2.0 * c2[2] * dbdn1 + dcdn1) / g[2]
+      vy=-(2.0 * c2[2] * dbdn2 + dcdn2) / g[2]
+      vz=-(2.0 * c2[2] * dbdn3 + dcdn3) / g[2]
+    
+  else:
+    g = 2.0 * pv * (3.0 * c4 + 2.0 * bb * c2 + cc)
+    if sol == 'sol_1':
+      vx=-(c4[0] * dbdn1 + c2[0] * dcdn1 + dddn1) / g[0]
+      vy=-(c4[0] * dbdn2 + c2[0] * dcdn2 + dddn2) / g[0]
+      vz=-(c4[0] * dbdn3 + c2[0] * dcdn3 + dddn3) / g[0]
+      
+    elif sol == 'sol_2':
+      vx=-(c4[1] * dbdn1 + c2[1] * dcdn1 + dddn1) / g[1]
+      vy=-(c4[1] * dbdn2 + c2[1] * dcdn2 + dddn2) / g[1]
+      vz=-(c4[1] * dbdn3 + c2[1] * dcdn3 + dddn3) / g[1]
+    
+    elif sol == 'sol_3':
+      vx=-(c4[2] * dbdn1 + c2[2] * dcdn1 + dddn1) / g[2]
+      vy=-(c4[2] * dbdn2 + c2[2] * dcdn2 + dddn2) / g[2]
+      vz=-(c4[2] * dbdn3 + c2[2] * dcdn3 + dddn3) / g[2]
+  
+  
+  v0x=np.real(vx)
+  v0y=np.real(vy)
+  v0z=np.real(vz)
+     
+  return v0x,v0y,v0z
+
+def voigt21(C):
+  # 21 independent components (a11,a12,...,a16,a22,...,a66) of a (21,) or 6x6 stiffness
+  C = np.asarray(C, dtype=float)
+  if C.shape == (6, 6):
+    return C[np.triu_indices(6)]
+  return C.reshape(21)
+
+SOLS = ['sol_1', 'sol_2', 'sol_3']
+
+def vel_terms(C, N):
+  # Christoffel invariants, their derivatives and the three roots c2 for an (M,3) array of
+  # unit wave vectors N, shared by all the solutions computed from them with vel_mode()
+  
+  N = np.asarray(N, dtype=float).reshape(-1, 3)
+  
+  terms = christoffel(*voigt21(C), N[:,0], N[:,1], N[:,2])
+  
+  return terms, cubic_batch(terms[0], terms[1], terms[2])
+
+def vel_mode(terms, c2, k):
+  # group velocity of solution k (0: qP, 1: qS1, 2: qS2) from the output of vel_terms()
+  
+  bb,cc,dd,dbdn1,dbdn2,dbdn3,dcdn1,dcdn2,dcdn3,dddn1,dddn2,dddn3 = terms
+
+  c4 = c2 * c2
+  pv = np.sqrt(np.abs(c2))
+  EPS = 10**-7
+  
+  nRoot2 = np.abs(pv[1] - pv[2]) < EPS
+  nRoot1 = nRoot2 & (np.abs(pv[0] - pv[2]) < EPS)
+  
+  with np.errstate(divide='ignore', invalid='ignore'):
+    g = 2.0 * pv[k] * (3.0 * c4[k] + 2.0 * bb * c2[k] + cc)
+    vx=-(c4[k] * dbdn1 + c2[k] * dcdn1 + dddn1) / g
+    vy=-(c4[k] * dbdn2 + c2[k] * dcdn2 + dddn2) / g
+    vz=-(c4[k] * dbdn3 + c2[k] * dcdn3 + dddn3) / g
+    
+    if k > 0:
+      g = 4.0 * pv[k] * (3.0 * c2[k] + bb)
+      vx = np.where(nRoot2, -(2.0 * c2[k] * dbdn1 + dcdn1) / g, vx)
+      vy = np.where(nRoot2, -(2.0 * c2[k] * dbdn2 + dcdn2) / g, vy)
+      vz = np.where(nRoot2, -(2.0 * c2[k] * dbdn3 + dcdn3) / g, vz)
+    
+    g = 6.0 * pv[0]
+    vx = np.where(nRoot1, -dbdn1 / g, vx)
+    vy = np.where(nRoot1, -dbdn2 / g, vy)
+    vz = np.where(nRoot1, -dbdn3 / g, vz)
+  
+  # vel() keeps the real part of the complex solution, which vanishes for c2 <= 0
+  real = np.where(nRoot1, c2[0], c2[k]) > 0.0
+  
+  return np.where(real, vx, 0.0),np.where(real, vy, 0.0),np.where(real, vz, 0.0)
+
+def vel_batch(C, N, sol):
+  # array version of vel(): C are the density-normalized stiffness constants Cij/rho
+  # (21,) or 6x6, N is an (M,3) array of unit wave vectors, returns vx, vy, vz of shape (M,)
+  
+  terms, c2 = vel_terms(C, N)
+  
+  return vel_mode(terms, c2, SOLS.index(sol))
+
+def vel_batch_all(C, N):
+  # the three solutions (qP, qS1 and qS2) from a single evaluation of the Christoffel terms,
+  # returns a (3,3,M) array indexed as [solution, component (vx,vy,vz), direction]
+  
+  terms, c2 = vel_terms(C, N)
+  
+  return np.array([vel_mode(terms, c2, k) for k in range(3)])
+
+# per-thread hook called between chunks of the velocity evaluations, see checkpoints()
+_hooks = threading.local()
+HOOK_CHUNK = 8192
+
+@contextlib.contextmanager
+def checkpoints(hook):
+  # within the block, vel_batch_chunks() calls hook(done, total) before and after every chunk of
+  # HOOK_CHUNK wave vectors evaluated by the current thread, e.g. to report the progress of a
+  # surface. The hook may raise an exception to abort the computation
+  old = getattr(_hooks, 'hook', None)
+  _hooks.hook = hook
+  try:
+    yield
+  finally:
+    _hooks.hook = old
+
+def vel_batch_chunks(C, N):
+  # vel_batch_all() in chunks of HOOK_CHUNK wave vectors when a hook is set with checkpoints()
+  hook = getattr(_hooks, 'hook', None)
+  with timed('velocities', len(N)):
+    if hook is None:
+      return vel_batch_all(C, N)
+    
+    res = np.empty((3,3,len(N)))
+    for i in range(0, len(N), HOOK_CHUNK):
+      hook(i, len(N))
+      res[:,:,i:i+HOOK_CHUNK] = vel_batch_all(C, N[i:i+HOOK_CHUNK])
+    hook(len(N), len(N))
+  
+  return res
+
+# per-thread record of the wall time of the stages of a computation, see recording()
+_records = threading.local()
+
+@contextlib.contextmanager
+def recording(record):
+  # within the block, the stages timed() by the current thread add their wall time (s), number
+  # of calls and of wave vectors to record[stage]. The time of a stage excludes the stages nested
+  # in it, e.g. the velocities evaluated while building a mesh
+  old = getattr(_records, 'state', None)
+  _records.state = (os.getpid(), record, [])
+  try:
+    yield record
+  finally:
+    _records.state = old
+
+def current_record():
+  # record of the current thread set with recording(), None outside of it and in the processes
+  # forked within it (e.g. background jobs)
+  state = getattr(_records, 'state', None)
+  if state is None or state[0] != os.getpid():
+    return None
+  return state[1]
+
+@contextlib.contextmanager
+def timed(stage, points=0):
+  # stage of the computation recorded by recording(), no-op outside of it (also as a decorator)
+  state = getattr(_records, 'state', None)
+  if state is None or state[0] != os.getpid():
+    yield
+    return
+  
+  pid, record, nested = state
+  nested.append(0.0)
+  t = time.perf_counter()
+  try:
+    yield
+  finally:
+    dt = time.perf_counter() - t
+    inner = nested.pop()
+    if nested:
+      nested[-1] += dt
+    res = record.setdefault(stage, {'seconds': 0.0, 'calls': 0, 'points': 0})
+    res['seconds'] += dt - inner
+    res['calls'] += 1
+    res['points'] += points
+
+def laue_class(C, tol=1e-8):
+  # Laue class of the stiffness (21,) or 6x6 from the form of its constants: '6/mmm' for
+  # Hexagonal I (and isotropic), 'm-3m' for Cubic I, '-1' (centrosymmetry only) otherwise
+  c = np.zeros((6,6))
+  c[np.triu_indices(6)] = voigt21(C)
+  t = tol*np.abs(c).max()
+  
+  d = c.copy()
+  for i, j in [(0,0),(0,1),(0,2),(1,1),(1,2),(2,2),(3,3),(4,4),(5,5)]:
+    d[i,j] = 0.0
+  if np.abs(d).max() > t:
+    return '-1'
+  
+  if abs(c[0,0]-c[1,1]) <= t and abs(c[0,2]-c[1,2]) <= t and abs(c[3,3]-c[4,4]) <= t and abs(c[5,5]-0.5*(c[0,0]-c[0,1])) <= t:
+    return '6/mmm'
+  if np.ptp([c[0,0],c[1,1],c[2,2]]) <= t and np.ptp([c[0,1],c[0,2],c[1,2]]) <= t and np.ptp([c[3,3],c[4,4],c[5,5]]) <= t:
+    return 'm-3m'
+  return '-1'
+
+def unique_directions(M):
+  # indices of the first occurrence of each distinct row of M (rounded to 1e-12) and the index
+  # of the distinct row of every row, faster than np.unique(axis=0)
+  K = np.round(M, 12)
+  order = np.lexsort(K.T[::-1])
+  K = K[order]
+  new = np.ones(len(K), dtype=bool)
+  new[1:] = np.any(K[1:] != K[:-1], axis=1)
+  inverse = np.empty(len(K), dtype=int)
+  inverse[order] = np.cumsum(new) - 1
+  return order[new], inverse
+
+def vel_batch_sym(C, N, laue='auto'):
+  # vel_batch_all() evaluated only at the distinct directions of the irreducible wedge of the
+  # Laue class ('m-3m', '6/mmm', '-1' or 'auto' to detect it with laue_class(), None evaluates
+  # every direction), the velocity at the other directions is obtained from v(Rn) = Rv(n)
+  
+  N = np.asarray(N, dtype=float).reshape(-1, 3)
+  
+  if laue == 'auto':
+    laue = laue_class(C)
+  
+  if laue == 'm-3m':
+    # wedge 0 <= nx <= ny <= nz reached by sign changes and permutations
+    sgn = np.where(N < 0.0, -1.0, 1.0)
+    order = np.argsort(np.abs(N), axis=1)
+    M = np.take_along_axis(np.abs(N), order, axis=1)
+  elif laue == '6/mmm':
+    # half meridian ny = 0, nx >= 0, nz >= 0 reached by rotations around z and the mirror z -> -z
+    rho = np.hypot(N[:,0], N[:,1])
+    cphi = np.divide(N[:,0], rho, out=np.ones_like(rho), where=rho > 0.0)
+    sphi = np.divide(N[:,1], rho, out=np.zeros_like(rho), where=rho > 0.0)
+    sz = np.where(N[:,2] < 0.0, -1.0, 1.0)
+    M = np.stack((rho, np.zeros_like(rho), np.abs(N[:,2])), axis=-1)
+  elif laue == '-1':
+    # hemisphere nz > 0 (or nz = 0, ny > 0, or nz = ny = 0, nx > 0) since v(-n) = -v(n)
+    K = np.round(N, 12)
+    sgn = np.where((K[:,2] < 0.0) | ((K[:,2] == 0.0) & ((K[:,1] < 0.0) | ((K[:,1] == 0.0) & (K[:,0] < 0.0)))), -1.0, 1.0)
+    M = N*sgn[:,None]
+  else:
+    return vel_batch_chunks(C, N)
+  
+  first, inverse = unique_directions(M)
+  vm = vel_batch_chunks(C, M[first])[:, :, inverse]
+  
+  res = np.empty_like(vm)
+  if laue == 'm-3m':
+    for k in range(3):
+      np.put_along_axis(res[k].T, order, vm[k].T*np.take_along_axis(sgn, order, axis=1), axis=1)
+  elif laue == '-1':
+    res[:] = vm*sgn
+  else:
+    res[:,0] = vm[:,0]*cphi - vm[:,1]*sphi
+    res[:,1] = vm[:,0]*sphi + vm[:,1]*cphi
+    res[:,2] = vm[:,2]*sz
+  
+  return res
+
+############## velocity surface cache shared by the gunicorn workers
+
+CACHE_DIR = os.environ.get('VELCRYS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'velcrys-cache'))
+CACHE_SIZE = int(os.environ.get('VELCRYS_CACHE_SIZE', 64))
+CACHE_BYTES = int(os.environ.get('VELCRYS_CACHE_BYTES', 2**32))
+CACHE_TMP_AGE = 86400
+
+def cache_key(*args):
+  # canonical hash of the float64 representation of the arguments (strings are hashed as text)
+  h = hashlib.sha1()
+  for arg in args:
+    if isinstance(arg, str):
+      h.update(arg.encode())
+    else:
+      h.update(np.asarray(arg, dtype=float).tobytes())
+  return h.hexdigest()
+
+@timed('cache')
+def cache_load(key):
+  # memory-mapped cached array or None, the file mtime records the last use for the LRU eviction
+  if CACHE_SIZE <= 0:
+    return None
+  path = os.path.join(CACHE_DIR, key + '.npy')
+  try:
+    res = np.load(path, mmap_mode='r')
+    os.utime(path)
+  except (OSError, ValueError):
+    return None
+  return res
+
+@timed('cache')
+def cache_save(key, res):
+  # arrays larger than the whole cache are not kept
+  if CACHE_SIZE <= 0 or res.nbytes > CACHE_BYTES:
+    return
+  path = os.path.join(CACHE_DIR, key + '.npy')
+  try:
+    tmp = cache_tmp(key)
+  except OSError:
+    return
+  try:
+    with open(tmp, 'wb') as f:
+      np.save(f, res)
+    os.replace(tmp, path)
+  except OSError:
+    remove_quietly(tmp)
+    return
+  except BaseException:
+    remove_quietly(tmp)
+    raise
+  cache_evict()
+
+def cache_tmp(key):
+  # new temporary file of CACHE_DIR, unique for every thread and process writing the same key
+  os.makedirs(CACHE_DIR, exist_ok=True)
+  fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=key+'.', suffix='.tmp')
+  os.close(fd)
+  return tmp
+
+def remove_quietly(path):
+  try:
+    os.remove(path)
+  except OSError:
+    pass
+
+def cache_stream(key, fill):
+  # like cache_save() for arrays that should not be held in memory: fill(path) writes the .npy
+  # file chunk by chunk and the result is returned memory-mapped. With key=None or without the
+  # cache the file is temporary and removed as soon as it is mapped
+  path = None
+  if key is not None and CACHE_SIZE > 0:
+    try:
+      tmp = cache_tmp(key)
+      path = os.path.join(CACHE_DIR, key + '.npy')
+    except OSError:
+      pass
+  
+  if path is None:
+    fd, tmp = tempfile.mkstemp(prefix='velcrys-', suffix='.npy')
+    os.close(fd)
+    try:
+      fill(tmp)
+      return np.load(tmp, mmap_mode='r')
+    finally:
+      os.remove(tmp)
+  
+  # a partly written file (Superseded, cancelled job or any error) is not left in CACHE_DIR
+  try:
+    fill(tmp)
+  except BaseException:
+    remove_quietly(tmp)
+    raise
+  try:
+    if os.path.getsize(tmp) > CACHE_BYTES:
+      raise OSError('larger than the cache')
+    os.replace(tmp, path)
+  except OSError:
+    # not cached, returned like a temporary file
+    try:
+      return np.load(tmp, mmap_mode='r')
+    finally:
+      remove_quietly(tmp)
+  res = np.load(path, mmap_mode='r')
+  cache_evict()
+  
+  return res
+
+def cache_evict():
+  # removes the least recently used files beyond CACHE_SIZE files or CACHE_BYTES bytes and the
+  # temporary files left for more than CACHE_TMP_AGE seconds by killed processes
+  for f in glob.glob(os.path.join(CACHE_DIR, '*.tmp')):
+    try:
+      if os.path.getmtime(f) < time.time() - CACHE_TMP_AGE:
+        os.remove(f)
+    except OSError:
+      pass
+  stat = {}
+  for f in glob.glob(os.path.join(CACHE_DIR, '*.npy')):
+    try:
+      stat[f] = os.stat(f)
+    except OSError:
+      pass
+  count, size = len(stat), sum(st.st_size for st in stat.values())
+  for f in sorted(stat, key=lambda f: stat[f].st_mtime):
+    if count <= CACHE_SIZE and size <= CACHE_BYTES:
+      break
+    remove_quietly(f)
+    count, size = count-1, size-stat[f].st_size
+
+def surface_modes(A, n, mesh='grid'):
+  # vel_batch_all() on the wave vectors of the 3D plots (see mesh_directions()) for the 21 constants
+  # A=Cij/rho. Cached on disk with the three solutions, so the key only depends on Cij/rho and the mesh
+  
+  key = cache_key(A, n, mesh)
+  res = cache_load(key)
+  if res is not None:
+    return res
+  
+  if mesh == 'grid' and n*n > CHUNK:
+    return cache_stream(key, lambda path: stream_npy(path, (3,3,n,n), surface_chunks(A, n)))
+  
+  N, shape = mesh_directions(n, mesh)
+  res = vel_batch_sym(A, N).reshape((3,3)+shape)
+  res.flags.writeable = False
+  cache_save(key, res)
+  
+  return res
+
+def sphere_grid(n, rows=slice(None)):
+  # (n*n,3) unit wave vectors of the n x n (θ,φ) grid used in the 3D plots, or of some of its θ rows
+  aa=complex(0,n)
+  u = np.mgrid[0:np.pi:aa][rows][:,None]
+  v = np.mgrid[0:2*np.pi:aa][None,:]
+  return np.stack(np.broadcast_arrays(np.sin(u)*np.cos(v),np.sin(u)*np.sin(v),np.cos(u)),axis=-1).reshape(-1,3)
+
+############## streamed evaluation of large grids
+
+# wave vectors evaluated at once on grids larger than this, bounding the memory of the workers
+CHUNK = int(os.environ.get('VELCRYS_CHUNK', 2**18))
+
+def grid_chunks(n, chunk=CHUNK):
+  # θ rows of the n x n grid in bands of about chunk wave vectors, each band together with its
+  # mirror band θ -> π-θ that holds the opposite directions (see vel_batch_sym())
+  half = (n+1)//2
+  step = max(1, chunk//(2*n))
+  for r0 in range(0, half, step):
+    r1 = min(r0+step, half)
+    yield np.unique(np.r_[r0:r1, n-r1:n-r0])
+
+def surface_chunks(A, n, chunk=CHUNK):
+  # generator of the θ rows of the n x n grid and their velocities (3,3,rows,n), see surface_modes()
+  for rows in grid_chunks(n, chunk):
+    yield rows, vel_batch_sym(A, sphere_grid(n, rows)).reshape(3,3,len(rows),n)
+
+def stream_npy(path, shape, chunks):
+  # writes the (rows, values) pairs of the generator chunks into the rows (axis -2) of a new
+  # preallocated float64 .npy file, so only one chunk is in memory at a time
+  out = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=shape)
+  for rows, res in chunks:
+    out[..., rows, :] = res
+  out.flush()
+  del out
+
+@functools.lru_cache(maxsize=4)
+@timed('mesh')
+def fibonacci_sphere(nn):
+  # about nn quasi-uniform unit wave vectors (Fibonacci lattice on the upper hemisphere and their
+  # opposite directions, see vel_batch_sym()) and the triangles of their convex hull for go.Mesh3d
+  m = max(nn//2, 4)
+  i = np.arange(m)
+  z = 1.0 - (2.0*i+1.0)/(2.0*m)
+  phi = i*np.pi*(3.0-np.sqrt(5.0))
+  r = np.sqrt(1.0-z**2)
+  N = np.stack((r*np.cos(phi),r*np.sin(phi),z),axis=-1)
+  N = np.concatenate((N,-N))
+  tri = fibonacci_triangles(N, m)
+  N.flags.writeable = False
+  tri.flags.writeable = False
+  return N, tri
+
+# points of the Fibonacci lattice around the pole triangulated by their convex hull in
+# fibonacci_triangles(), where the lattice is too irregular to follow its Fibonacci vectors
+POLE_CAP = 256
+
+def fibonacci_triangles(N, m):
+  # triangles of the convex hull (the Delaunay triangulation) of the Fibonacci lattice N, its m
+  # points on the upper hemisphere followed by their opposites, without the O(N log N) hull of all
+  # of them: away from the poles and the equator the neighbours of the point i are i+F[k] for the
+  # Fibonacci numbers F[k] of the local spacing, so the lattice is tiled by the parallelograms
+  # (i, i+F[k], i+F[k]+F[k+1], i+F[k+1]), each split along the diagonal of the empty circumcircle. The
+  # polar caps and the equatorial band are the hulls of their few points, and the result falls
+  # back to the full hull if it is not a closed surface (e.g. cocircular points split differently)
+  from scipy.spatial import ConvexHull
+  
+  if m <= 2*POLE_CAP:
+    return ConvexHull(N).simplices
+  
+  hook = getattr(_hooks, 'hook', None)
+  if hook is not None:
+    hook(0, len(N))
+  
+  h = np.sqrt(2.0*np.pi/m)  # spacing of the lattice
+  F = [1, 2]
+  while F[-1] < m:
+    F.append(F[-1]+F[-2])
+  F = np.array(F)
+  
+  # the vector F[k] has the length l[k]^2 = (F[k]/m)^2/u + (2π d[k])^2 u at u=1-z^2, d[k] the distance
+  # of F[k]/φ^2 to the closest integer. Anchors use the family (F[k], F[k+1]) from the u where
+  # l[k-1] = l[k+1] to the u where l[k] = l[k+2], the middle of the ranges where F[k], F[k+1] and
+  # F[k+2] are the edges whichever the family, so the parallelograms of two families meet there
+  a = (F/m)**2
+  b = (2.0*np.pi*(F*(2.0/(3.0+np.sqrt(5.0))) - np.round(F*(2.0/(3.0+np.sqrt(5.0))))))**2
+  k = np.arange(1, len(F)-1)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    ub = np.sqrt((a[k+1]-a[k-1])/(b[k-1]-b[k+1]))
+  i = np.arange(m)
+  u = 1.0 - (1.0 - (2.0*i+1.0)/(2.0*m))**2
+  k = np.clip(np.searchsorted(ub, u, side='right'), 1, len(F)-3)
+  
+  ia, ib = i+F[k], i+F[k+1]
+  ic = ia+F[k+1]
+  ok = ic < m
+  i, ia, ib, ic = i[ok], ia[ok], ib[ok], ic[ok]
+  n = np.cross(N[ia]-N[i], N[ic]-N[i])
+  n *= np.sign(np.einsum('ij,ij->i', n, N[i]))[:,None]
+  long = np.einsum('ij,ij->i', n, N[ib]-N[i]) <= 0.0   # i+F[k+1] out of the circumcircle of (i, i+F[k], i+F[k+2])
+  tri = [np.stack((i, ia, ic), -1)[long], np.stack((i, ic, ib), -1)[long],
+         np.stack((i, ia, ib), -1)[~long], np.stack((ia, ic, ib), -1)[~long]]
+  
+  # where the family changes from k-1 to k the triangles (j, j+F[k-1], j+F[k+1]) of the first F[k]
+  # anchors j of the family k belong to no parallelogram
+  for s in np.nonzero(np.diff(k))[0]+1:
+    j = np.arange(s, s+F[k[s]])
+    j = j[j+F[k[s]+1] < m]
+    tri.append(np.stack((j, j+F[k[s]-1], j+F[k[s]+1]), -1))
+  tri = np.concatenate(tri)
+  
+  def centroids(tri):
+    c = N[tri].sum(axis=1)
+    return c[:,2]/np.linalg.norm(c, axis=1)
+  
+  def local_hull(idx, keep):
+    # faces of the hull of the points idx that are faces of the hull of all the points, the
+    # others are across the hole of the band (or the base of the cap) far from the sphere
+    hull = ConvexHull(N[idx])
+    tri = idx[hull.simplices]
+    return tri[keep(centroids(tri)) & (-hull.equations[:,3] > 1.0-2.0*h**2)]
+  
+  zp = N[POLE_CAP,2]
+  ze = 4.0*h
+  z = centroids(tri)
+  tri = tri[(z < zp) & (z > ze)]
+  tri = np.concatenate((tri, local_hull(np.arange(2*POLE_CAP), lambda z: z >= zp)))
+  tri = np.concatenate((tri, tri+m, local_hull(np.nonzero(np.abs(N[:,2]) < ze+4.0*h)[0], lambda z: np.abs(z) <= ze)))
+  
+  if hook is not None:
+    hook(0, len(N))
+  if not closed_surface(N, tri):
+    return ConvexHull(N).simplices
+  return tri.astype(np.intc)
+
+def closed_surface(N, tri):
+  # whether the triangles tile the unit sphere once: as many as for a closed surface of genus 0,
+  # every edge shared by two of them in opposite directions once oriented outwards, and their solid
+  # angles adding up to 4π
+  M = len(N)
+  if len(tri) != 2*M-4:
+    return False
+  a, b, c = N[tri[:,0]], N[tri[:,1]], N[tri[:,2]]
+  num = np.einsum('ij,ij->i', a, np.cross(b, c))
+  if (num == 0.0).any():
+    return False
+  tri = np.where((num < 0.0)[:,None], tri[:,[0,2,1]], tri).astype(np.int64)
+  e = np.concatenate((tri[:,[0,1]], tri[:,[1,2]], tri[:,[2,0]]))
+  fwd = np.sort(e[:,0]*M + e[:,1])
+  rev = np.sort(e[:,1]*M + e[:,0])
+  if (np.diff(fwd) == 0).any() or not np.array_equal(fwd, rev):
+    return False
+  den = 1.0 + np.einsum('ij,ij->i', a, b) + np.einsum('ij,ij->i', b, c) + np.einsum('ij,ij->i', c, a)
+  return abs(2.0*np.arctan2(np.abs(num), den).sum() - 4.0*np.pi) < 1e-6
+
+@functools.lru_cache(maxsize=8)
+@timed('mesh')
+def adaptive_sphere(A, nn, tol=1e-3, gap=0.05):
+  # about nn unit wave vectors for the constants A=Cij/rho, starting from the Fibonacci lattice of
+  # nn/4 points and refined where the three velocity surfaces change fast (cusps) or the qS1 and
+  # qS2 phase velocities n.v approach each other (conical points where vel() switches between its
+  # nRoot branches). Returns the directions, their convex hull triangles and the (3,3,M) velocities
+  nn = int(nn)
+  
+  N, tri = fibonacci_sphere(max(nn//4, 12))
+  N = np.array(N)
+  tri = outwards(N, tri)
+  nbr = triangle_neighbours(tri)
+  anti = (np.arange(len(N)) + len(N)//2) % len(N)
+  V = vel_batch_sym(A, N)
+  W = np.nan_to_num(V, posinf=0.0, neginf=0.0)
+  c = np.einsum('kim,mi->km', W, N)
+  
+  def edge_jumps(t):
+    # largest jump of the group velocity of any solution along the edges of the triangles t and
+    # the closest qS1 and qS2 phase velocities at their vertices
+    jump = np.zeros(len(t))
+    for a, b in [(0,1),(1,2),(2,0)]:
+      jump = np.maximum(jump, np.sqrt(((W[:,:,t[:,a]]-W[:,:,t[:,b]])**2).sum(axis=1)).max(axis=0))
+    return jump, np.abs(c[1]-c[2])[t].min(axis=1)
+  
+  jump, near = edge_jumps(tri)
+  
+  while nn - len(N) >= max(6, nn//100):
+    # largest jump along the edges of every triangle, increased near the degeneracies of the qS1
+    # and qS2 solutions. Only the triangles changed by the last refinement are evaluated again
+    vref = np.abs(c[0]).max()
+    score = jump/vref*(1.0 + 10.0*np.exp(-near/vref/gap))
+    
+    count = (score > tol).sum()
+    if not count:
+      break
+    count = max(1, min(count, (nn-len(N))//6, len(tri)//4))
+    
+    # every refined triangle adds at most its 3 edge midpoints and their opposite directions, the
+    # midpoints of the opposite edges (when they are edges too), inserted into the triangulation
+    # by split_edges() instead of taking the convex hull of all the points again
+    t = np.repeat(np.argpartition(-score, count-1)[:count], 3)
+    j = np.tile(np.arange(3), len(t)//3)
+    a, b = tri[t, j], tri[t, (j+1)%3]
+    sym = (anti[a] >= 0) & (anti[b] >= 0)
+    first = np.empty(len(N), dtype=np.intp)
+    first[tri] = np.arange(len(tri))[:,None]
+    o = edge_triangles(tri, nbr, first, anti[b[sym]], anti[a[sym]])
+    where = np.concatenate((t, o[o >= 0]))
+    a, b = np.concatenate((a, anti[b[sym]][o >= 0])), np.concatenate((b, anti[a[sym]][o >= 0]))
+    
+    M = len(N)
+    key, i = np.unique(np.minimum(a, b).astype(np.int64)*M + np.maximum(a, b), return_index=True)
+    where, a, b = where[i], a[i], b[i]
+    opp = np.minimum(anti[a], anti[b]).astype(np.int64)*M + np.maximum(anti[a], anti[b])
+    pair = np.minimum(np.searchsorted(key, opp), len(key)-1)
+    anti = np.concatenate((anti, np.where((key[pair] == opp) & (anti[a] >= 0) & (anti[b] >= 0), M+pair, -1)))
+    
+    P = N[a] + N[b]
+    P /= np.linalg.norm(P, axis=1)[:,None]
+    N = np.concatenate((N, P))
+    tri, nbr, changed = split_edges(N, tri, nbr, where, a, b, M+np.arange(len(P)))
+    
+    vv = vel_batch_sym(A, P)
+    V = np.concatenate((V, vv), axis=2)
+    vv = np.nan_to_num(vv, posinf=0.0, neginf=0.0)
+    W = np.concatenate((W, vv), axis=2)
+    c = np.concatenate((c, np.einsum('kim,mi->km', vv, P)), axis=1)
+    jump, near = np.resize(jump, len(tri)), np.resize(near, len(tri))
+    jump[changed], near[changed] = edge_jumps(tri[changed])
+  
+  tri = tri.astype(np.intc)
+  N.flags.writeable = False
+  tri.flags.writeable = False
+  V.flags.writeable = False
+  
+  return N, tri, V
+
+def outwards(N, tri):
+  # the triangles tri of a closed surface around the origin with their vertices counterclockwise
+  # seen from outside
+  a, b, c = N[tri[:,0]], N[tri[:,1]], N[tri[:,2]]
+  return np.where((np.einsum('ij,ij->i', a, np.cross(b, c)) < 0.0)[:,None], tri[:,[0,2,1]], tri).astype(np.intp)
+
+def triangle_neighbours(tri, nbr=None, rows=None):
+  # nbr[t,j] the triangle across the edge (tri[t,j], tri[t,j+1]) of the triangles of outwards(),
+  # only updated for the edges shared by two of the triangles rows if given
+  if nbr is None:
+    nbr = np.full(tri.shape, -1, dtype=np.intp)
+  if rows is None:
+    rows = np.arange(len(tri))
+  t = tri[rows]
+  M = np.int64(t.max()) + 1
+  fwd = (t.astype(np.int64)*M + t[:,[1,2,0]]).ravel()
+  rev = (t[:,[1,2,0]].astype(np.int64)*M + t).ravel()
+  order = np.argsort(fwd)
+  pos = np.minimum(np.searchsorted(fwd, rev, sorter=order), len(fwd)-1)
+  idx = np.nonzero(fwd[order[pos]] == rev)[0]
+  nbr[rows[idx//3], idx%3] = rows[order[pos[idx]]//3]
+  return nbr
+
+def edge_triangles(tri, nbr, first, a, b):
+  # triangle with the edge from a to b of the triangles of triangle_neighbours(), turning around
+  # a from its triangle first[a], or -1 if (a,b) is no edge
+  res = np.full(len(a), -1, dtype=np.intp)
+  todo = np.arange(len(a))
+  x = first[a]
+  start = x
+  while len(todo):
+    j = np.argmax(tri[x] == a[:,None], axis=1)
+    hit = tri[x, (j+1)%3] == b
+    res[todo[hit]] = x[hit]
+    x = nbr[x, (j+2)%3]
+    more = ~hit & (x != start)
+    todo, x, start, a, b = todo[more], x[more], start[more], a[more], b[more]
+  return res
+
+def split_edges(N, tri, nbr, where, a, b, p):
+  # inserts the new points p of N at the edges (a,b) of the triangles where of the Delaunay
+  # triangulation tri (see outwards() and triangle_neighbours()), dividing every triangle by the
+  # points on its edges, and flips the edges that are no longer Delaunay (Lawson) until it is the
+  # convex hull again. Returns the triangles, their neighbours and the indices of those changed
+  j = np.argmax(tri[where] == a[:,None], axis=1)
+  s = nbr[where, j]
+  t, i = np.unique(np.concatenate((where, s)), return_inverse=True)
+  mid = np.full((len(t), 3), -1, dtype=np.intp)
+  mid[i[:len(p)], j] = p
+  mid[i[len(p):], np.argmax(tri[s] == b[:,None], axis=1)] = p
+  
+  # rotated so that the edge 0 is split (1 point), the edge 2 is not (2 points)
+  k = (mid >= 0).sum(axis=1)
+  r = np.where(k == 1, np.argmax(mid >= 0, axis=1), (np.argmax(mid < 0, axis=1)+1)%3)
+  r = (r[:,None] + np.arange(3)) % 3
+  v, m = tri[t[:,None], r], np.take_along_axis(mid, r, axis=1)
+  v0, v1, v2, m0, m1, m2 = v[:,0], v[:,1], v[:,2], m[:,0], m[:,1], m[:,2]
+  children = [np.stack((v0, m0, v2), -1)[k == 1], np.stack((m0, v1, v2), -1)[k == 1],
+              np.stack((v0, m0, m1), -1)[k == 2], np.stack((m0, v1, m1), -1)[k == 2], np.stack((v0, m1, v2), -1)[k == 2],
+              np.stack((v0, m0, m2), -1)[k == 3], np.stack((m0, v1, m1), -1)[k == 3], np.stack((m2, m1, v2), -1)[k == 3], np.stack((m0, m1, m2), -1)[k == 3]]
+  parents = np.concatenate((t[k == 1], t[k == 2], t[k == 3]))
+  rows = np.unique(np.concatenate((t, nbr[t].ravel())))
+  new = np.arange(len(tri), len(tri) + sum(map(len, children)) - len(parents))
+  tri = np.concatenate((tri, np.zeros((len(new), 3), dtype=tri.dtype)))
+  tri[np.concatenate((parents, new))] = np.concatenate(children[0:1] + children[2:3] + children[5:6] + children[1:2] + children[3:5] + children[6:9])
+  nbr = np.concatenate((nbr, np.full((len(new), 3), -1, dtype=nbr.dtype)))
+  nbr[t] = -1
+  triangle_neighbours(tri, nbr, np.concatenate((rows, new)))
+  changed = [t, new]
+  
+  dirty = np.concatenate((t, new))
+  for _ in range(100):
+    t = np.repeat(dirty, 3)
+    j = np.tile(np.arange(3), len(dirty))
+    s = nbr[t, j]
+    a, b, c = tri[t, j], tri[t, (j+1)%3], tri[t, (j+2)%3]
+    d = tri[s, (np.argmax(tri[s] == b[:,None], axis=1)+2)%3]
+    # d in the circumcircle of (a,b,c), i.e. beyond their plane, each edge tested from one side
+    n = np.cross(N[b]-N[a], N[c]-N[a])
+    flip = np.einsum('ij,ij->i', n, N[d]-N[a]) > 1e-12*np.linalg.norm(n, axis=1)*np.linalg.norm(N[d]-N[a], axis=1)
+    mark = np.zeros(len(tri), dtype=bool)
+    mark[dirty] = True
+    flip &= (t < s) | ~mark[s]
+    if not flip.any():
+      return tri, nbr, np.unique(np.concatenate(changed))
+    t, s, a, b, c, d = t[flip], s[flip], a[flip], b[flip], c[flip], d[flip]
+    dirty = np.unique(np.concatenate((t, s)))
+    sel = independent(t, s)
+    t, s, a, b, c, d = t[sel], s[sel], a[sel], b[sel], c[sel], d[sel]
+    rows = np.unique(np.concatenate((t, s, nbr[t].ravel(), nbr[s].ravel())))
+    tri[t] = np.stack((a, d, c), -1)
+    tri[s] = np.stack((d, b, c), -1)
+    nbr[np.concatenate((t, s))] = -1
+    triangle_neighbours(tri, nbr, rows)
+    changed.append(np.concatenate((t, s)))
+  
+  from scipy.spatial import ConvexHull
+  tri = outwards(N, ConvexHull(N).simplices)
+  return tri, triangle_neighbours(tri), np.arange(len(tri))
+
+def independent(t, s):
+  # which of the pairs of triangles (t,s) to change at once, those with the smallest index among
+  # the pairs of both of their triangles
+  e = np.arange(len(t))
+  ids, inv = np.unique(np.concatenate((t, s)), return_inverse=True)
+  best = np.full(len(ids), len(t))
+  np.minimum.at(best, inv, np.tile(e, 2))
+  return (best[inv[:len(t)]] == e) & (best[inv[len(t):]] == e)
+
+def mesh_directions(n, mesh='grid'):
+  # unit wave vectors of the 3D plots and the shape of the plotted arrays: the n x n (θ,φ) grid
+  # or the Fibonacci lattice of about n points
+  if mesh == 'fibonacci':
+    N = fibonacci_sphere(n)[0]
+    return N, (len(N),)
+  return sphere_grid(n), (n,n)
+
+@functools.lru_cache(maxsize=8)
+def fractional_change(A, A0, n, mesh='grid'):
+  # (v-v0)/v0 of the three solutions on the plot mesh, v with the constants A=(Cij+ΔCij)/rho and
+  # v0 with A0=Cij/rho. The field-free v0 comes from the shared surface cache and is reused while
+  # the field or the magnetic constants change, v is not stored there since it depends on all of them
+  
+  if mesh == 'grid' and n*n > CHUNK:
+    return cache_stream(None, lambda path: stream_npy(path, (3,n,n), change_chunks(A, A0, n)))
+  
+  N, shape = mesh_directions(n, mesh)
+  vv = vel_batch_sym(A, N).reshape((3,3)+shape)
+  v0 = np.sqrt(vv[:,0]**2+vv[:,1]**2+vv[:,2]**2)
+  
+  vv = surface_modes(A0, n, mesh)
+  v00 = np.sqrt(vv[:,0]**2+vv[:,1]**2+vv[:,2]**2)
+  
+  res = (v0-v00)/v00
+  res.flags.writeable = False
+  
+  return res
+
+def change_chunks(A, A0, n):
+  # generator of the θ rows of the n x n grid and (v-v0)/v0 (3,rows,n), see fractional_change()
+  vv0 = surface_modes(A0, n)
+  for rows, vv in surface_chunks(A, n):
+    v0 = np.sqrt(vv[:,0]**2+vv[:,1]**2+vv[:,2]**2)
+    vv = vv0[:,:,rows]
+    v00 = np.sqrt(vv[:,0]**2+vv[:,1]**2+vv[:,2]**2)
+    yield rows, (v0-v00)/v00
+
+def unaryCubicEquation(B, C, D):
+    # solve equation x**3 + Bx**2 + Cx + D = 0
+    w = complex(-0.5, cmath.sqrt(0.75))
+    w2 = w * w
+    res = [0, 0, 0]
+    sig = 1
+    P = B * C / 6.0 - B ** 3 / 27.0 - 0.5 * D
+    Q = (3.0 * C - B * B) / 9.0
+    v = cmath.sqrt(P * P + Q ** 3)
+    u = P + v
+    v = P - v
+    if abs(v) > abs(u):
+        u = v
+        sig = -1
+    u = u ** (1.0 / 3.0)
+    if abs(u) > 1.0e-15:
+        v = -Q / u
+    else:
+        v = 0.0
+    res[0] = -B / 3.0
+    res[0] += u + v
+    res[1] = -B / 3.0
+    res[1] += u * w + v * w2    
+    res[2] = -B / 3.0
+    res[2] += u * w2 + v * w
+
+    return res
+
+def cubic_batch(B, C, D):
+    # solve equation x**3 + Bx**2 + Cx + D = 0 for arrays of coefficients with three real
+    # roots (symmetric Christoffel matrix) using the trigonometric form. Returns a (3,...)
+    # float64 array ordered as in unaryCubicEquation: largest, smallest and middle root
+    B, C, D = np.broadcast_arrays(np.asarray(B, dtype=float), np.asarray(C, dtype=float), np.asarray(D, dtype=float))
+    P = B * C / 6.0 - B ** 3 / 27.0 - 0.5 * D
+    Q = (3.0 * C - B * B) / 9.0
+    r = np.sqrt(np.maximum(-Q, 0.0))
+    r3 = r ** 3
+    t = np.divide(P, r3, out=np.ones_like(P), where=r3 > 0.0)
+    t = np.arccos(np.clip(t, -1.0, 1.0)) / 3.0
+    res = np.empty((3,) + B.shape)
+    res[0] = -B / 3.0 + 2.0 * r * np.cos(t)
+    res[1] = -B / 3.0 + 2.0 * r * np.cos(t + 2.0 * np.pi / 3.0)
+    res[2] = -B / 3.0 + 2.0 * r * np.cos(t - 2.0 * np.pi / 3.0)
+
+    return res
+
+
+
+##############magnetic free energy
+
+def enecub(x,a):
+
+  hx0=a[0]
+  hy0=a[1]
+  hz0=a[2]
+  Ms0=a[3]
+  k1eff0=a[4]
+  k2eff0=a[5]
+  theta=x[0]
+  phi=x[1]
+  
+  return k1eff0*(((np.sin(theta)*np.cos(phi))**2)*(np.sin(theta)*np.sin(phi))**2 + ((np.sin(theta)*np.cos(phi))**2)*np.cos(theta)**2 + (np.sin(theta)*np.sin(phi))**2*np.cos(theta)**2) + k2eff0*((np.sin(theta)*np.cos(phi))**2)*(np.sin(theta)*np.sin(phi))**2*np.cos(theta)**2 - Ms0*(np.sin(theta)*np.cos(phi)*hx0 + np.sin(theta)*np.sin(phi)*hy0 + np.cos(theta)*hz0)
+
+
+
+def ett(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
+  
+  ff0 = -0.5*ms*(-hhz*np.cos(x) - hhx*np.cos(y)*np.sin(x) - hhy*np.sin(x)*np.sin(y))
+  ff1 = kk1eff*(2.0*np.cos(x)**4*np.cos(y)**2 - 12.0*np.cos(x)**2*np.cos(y)**2*np.sin(x)**2 + 2.0*np.cos(y)**2*np.sin(x)**4 + 2.0*np.cos(x)**4*np.sin(y)**2 - 12.0*np.cos(x)**2*np.sin(x)**2*np.sin(y)**2 + 12.0*np.cos(x)**2*np.cos(y)**2*np.sin(x)**2*np.sin(y)**2 + 2.0*np.sin(x)**4*np.sin(y)**2 - 4.0*np.cos(y)**2*np.sin(x)**4*np.sin(y)**2)
+  ff2 = kk2eff*(12.0*np.cos(x)**4*np.cos(y)**2*np.sin(x)**2*np.sin(y)**2 - 22.0*np.cos(x)**2*np.cos(y)**2*np.sin(x)**4*np.sin(y)**2 + 2.0*np.cos(y)**2*np.sin(x)**6*np.sin(y)**2)
+     
+
+  
+  ff=ff0+ff1+ff2 
+     
+  return ff
+     
+  
+def epp(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
+  ff0 = -0.5*ms*(-hhx*np.cos(y)*np.sin(x) - hhy*np.sin(x)*np.sin(y)) 
+  
+  ff1=kk1eff*(2.0*np.cos(y)**4*np.sin(x)**4 - 12.0*np.cos(y)**2*np.sin(x)**4*np.sin(y)**2 + 2.0*np.sin(x)**4*np.sin(y)**4)
+  
+  ff2=kk2eff*(2.0*np.cos(x)**2*np.cos(y)**4*np.sin(x)**4 - 12.0*np.cos(x)**2*np.cos(y)**2*np.sin(x)**4*np.sin(y)**2 + 2.0*np.cos(x)**2*np.sin(x)**4*np.sin(y)**4)
+
+  ff=ff0+ff1+ff2  
+     
+  return ff
+
+
+def enehex(x,a):
+
+  hx0=a[0]
+  hy0=a[1]
+  hz0=a[2]
+  Ms0=a[3]
+  k1eff0=a[4]
+  k2eff0=a[5]
+  theta=x[0]
+  phi=x[1]
+  
+  return k1eff0*(1-np.cos(theta)**2) + k2eff0**(1-np.cos(theta)**2)**2 - Ms0*(np.sin(theta)*np.cos(phi)*hx0 + np.sin(theta)*np.sin(phi)*hy0 + np.cos(theta)*hz0)
+
+
+
+def etth(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
+  
+  ff0 = -0.5*ms*(-hhz*np.cos(x) - hhx*np.cos(y)*np.sin(x) - hhy*np.sin(x)*np.sin(y))
+  ff1 = 2.0*kk1eff*(np.cos(x)**2 - np.sin(x)**2)
+  ff2 = kk2eff*(4.0*np.cos(x)**2*(1.0 - np.cos(x)*2) + 8.0*np.cos(x)**2*np.sin(x)**2 - 4.0*(1.0 - np.cos(x)**2)*np.sin(x)**2)
+     
+
+  
+  ff=ff0+ff1+ff2 
+     
+  return ff
+     
+  
+def epph(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
+  ff0 = -0.5*ms*(-hhx*np.cos(y)*np.sin(x) - hhy*np.sin(x)*np.sin(y)) 
+  
+  ff1=0.0
+  
+  ff2=0.0
+
+  ff=ff0+ff1+ff2  
+     
+  return ff
+
+
+############## surface files
+
+# binary surface file: SURFACE_MAGIC, the length of a JSON header (uint64, little endian) and the
+# header, followed by the arrays at 64-byte aligned offsets counted from the end of the header
+SURFACE_MAGIC = b'VELCRYS\x01'
+SURFACE_UNITS = {'C': 'Pa', 'rho': 'kg/m^3', 'n': '1', 'v': 'm/s', 'vx': 'm/s', 'vy': 'm/s', 'vz': 'm/s',
+                 'v0': 'm/s', 'change': '1'}
+MODES = ['qP', 'qS1', 'qS2']
+
+def align64(size):
+  return -(-size//64)*64
+
+def save_surface(path, C, rho, mesh, mode, vv, N=None, v0=None, dtype=np.float32):
+  # writes the velocity surface vv (3,...) = (vx,vy,vz) of one mode (qP, qS1 or qS2) of the elastic
+  # tensor C (Pa) and density rho (kg/m^3). mesh is {'type': 'grid', 'n': n} for the n x n (θ,φ)
+  # grid, {'type': 'fibonacci', 'n': nn} or any other mesh with its wave vectors N. With the speed
+  # v0 (...) of a reference tensor the fractional change (v-v0)/v0 is stored too. The arrays are
+  # written block by block, so memory-mapped surfaces of any size can be saved
+  
+  vv = [np.asarray(x) for x in vv]
+  shape = vv[0].shape
+  size = vv[0].size
+  flat = [x.reshape(-1) for x in vv]
+  v0 = None if v0 is None else v0.reshape(-1)
+  dtype = np.dtype(dtype)
+  
+  if mesh['type'] == 'grid':
+    n = mesh['n']
+    step = max(1, CHUNK//n)*n
+    directions = lambda s: sphere_grid(n, slice(s.start//n, s.stop//n))
+  else:
+    N = fibonacci_sphere(mesh['n'])[0] if N is None else N
+    N = np.asarray(N).reshape(-1, 3)
+    step = CHUNK
+    directions = lambda s: N[s]
+  blocks = [slice(i, min(i+step, size)) for i in range(0, size, step)]
+  
+  speed = lambda s: np.sqrt(flat[0][s]**2+flat[1][s]**2+flat[2][s]**2)
+  fields = [('n', shape+(3,), directions), ('v', shape, speed),
+            ('vx', shape, lambda s: flat[0][s]), ('vy', shape, lambda s: flat[1][s]), ('vz', shape, lambda s: flat[2][s])]
+  if v0 is not None:
+    fields += [('v0', shape, lambda s: v0[s]), ('change', shape, lambda s: (speed(s)-v0[s])/v0[s])]
+  
+  arrays, offset = {}, 0
+  for name, ashape, _ in fields:
+    arrays[name] = {'offset': offset, 'shape': list(ashape)}
+    offset += align64(int(np.prod(ashape))*dtype.itemsize)
+  
+  header = {'format': 'velcrys-surface', 'version': 1, 'C': [float(c) for c in voigt21(C)], 'rho': float(rho),
+            'mesh': mesh, 'mode': mode, 'dtype': dtype.str, 'units': SURFACE_UNITS, 'arrays': arrays}
+  header = json.dumps(header).encode()
+  header += b' '*(align64(len(SURFACE_MAGIC)+8+len(header)) - len(SURFACE_MAGIC)-8-len(header))
+  
+  fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path)+'.', suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(SURFACE_MAGIC + np.uint64(len(header)).astype('<u8').tobytes() + header)
+      for name, ashape, block in fields:
+        written = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+          for s in blocks:
+            data = np.ascontiguousarray(block(s), dtype=dtype).tobytes()
+            f.write(data)
+            written += len(data)
+        f.write(b'\0'*(align64(written)-written))
+    # mkstemp() creates the file readable by its owner only
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+  except BaseException:
+    remove_quietly(tmp)
+    raise
+
+def load_surface(path):
+  # header and read-only np.memmap arrays of a file written by save_surface()
+  with open(path, 'rb') as f:
+    magic = f.read(len(SURFACE_MAGIC))
+    if magic != SURFACE_MAGIC:
+      raise ValueError('%s is not a VelCrys surface file' % path)
+    size = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+    header = json.loads(f.read(size).decode())
+  
+  start = len(SURFACE_MAGIC) + 8 + size
+  arrays = {}
+  for name, a in header['arrays'].items():
+    arrays[name] = np.memmap(path, dtype=np.dtype(header['dtype']), mode='r', offset=start+a['offset'], shape=tuple(a['shape']))
+  
+  return header, arrays
+
+############## library interface (SI units)
+
+def cubic_stiffness(c11, c12, c44):
+  # 6x6 elastic tensor of a cubic I crystal
+  return np.array([[c11,c12,c12,0.0,0.0,0.0],
+                   [c12,c11,c12,0.0,0.0,0.0],
+                   [c12,c12,c11,0.0,0.0,0.0],
+                   [0.0,0.0,0.0,c44,0.0,0.0],
+                   [0.0,0.0,0.0,0.0,c44,0.0],
+                   [0.0,0.0,0.0,0.0,0.0,c44]])
+
+def hexagonal_stiffness(c11, c12, c13, c33, c44):
+  # 6x6 elastic tensor of a hexagonal I crystal, c66 = (c11-c12)/2
+  return np.array([[c11,c12,c13,0.0,0.0,0.0],
+                   [c12,c11,c13,0.0,0.0,0.0],
+                   [c13,c13,c33,0.0,0.0,0.0],
+                   [0.0,0.0,0.0,c44,0.0,0.0],
+                   [0.0,0.0,0.0,0.0,c44,0.0],
+                   [0.0,0.0,0.0,0.0,0.0,0.5*(c11-c12)]])
+
+def magnetic_cubic(ms,kk1,kk2,bb1,bb2,hx,hy,hz):
+  # magnetoelastic correction dCij (Pa, 6x6) of a cubic I crystal and the equilibrium direction
+  # of the magnetization (ax,ay,az). Same units as the web application: mu0 Ms and mu0 H (Tesla),
+  # K1, K2 (MJ/m^3) and b1, b2 (MPa)
+
+  theta, phi = equilibrium(enecub,[hx,hy,hz],ms,kk1,kk2)
+  dc, alpha = magnetic_cubic_batch(theta,phi,[hx,hy,hz],ms,kk1,kk2,bb1,bb2)[:2]
+  
+  return dc[0], alpha[0]
+
+def magnetic_hex(ms,kk1,kk2,bb21,bb22,bb3,bb4,hx,hy,hz):
+  # magnetoelastic correction dCij (Pa, 6x6) of a hexagonal I crystal and the equilibrium
+  # direction of the magnetization (ax,ay,az), see magnetic_cubic()
+
+  theta, phi = equilibrium(enehex,[hx,hy,hz],ms,kk1,kk2)
+  dc, alpha = magnetic_hex_batch(theta,phi,[hx,hy,hz],ms,kk1,kk2,bb21,bb22,bb3,bb4)[:2]
+  
+  return dc[0], alpha[0]
+
+def voigt66(*dc):
+  # (M,6,6) symmetric matrices from the 21 (M,) arrays of their components in the order of voigt21()
+  dc = np.broadcast_arrays(*dc)
+  i, j = np.triu_indices(6)
+  out = np.empty(dc[0].shape+(6,6))
+  out[...,i,j] = np.stack(dc,axis=-1)
+  out[...,j,i] = out[...,i,j]
+  return out
+
+def equilibrium(energy,H,ms,kk1,kk2):
+  # equilibrium angles (theta, phi) (M,) of the magnetization in the fields H (M,3): minimum of
+  # energy (enecub or enehex) found with Nelder-Mead from (0.2, 0.3), one field at a time. Same
+  # units as magnetic_cubic()
+  from scipy.optimize import minimize
+  
+  mu0 = 4.0*np.pi*10.0**(-7)
+  H = np.asarray(H, dtype=float).reshape(-1,3)
+  angles = np.empty((len(H),2))
+  with timed('minimize', len(H)):
+    for m, (hx,hy,hz) in enumerate(H):
+      a = [hx,hy,hz,ms/mu0,kk1*10.0**6,kk2*10.0**6]
+      angles[m] = minimize(energy,np.array([0.2,0.3]),args=(a),method='Nelder-Mead',options={'maxiter': 1000, 'maxfev': 1000, 'xatol': 0.0000001}).x
+  return angles[:,0], angles[:,1]
+
+def magnetic_cubic_batch(theta,phi,H,ms,kk1,kk2,bb1,bb2):
+  # magnetoelastic corrections dCij (Pa, (M,6,6)) of a cubic I crystal, directions of the
+  # magnetization (M,3) and susceptibility tensors chi (M,3,3) for M equilibrium angles (theta,
+  # phi) of the magnetization in the fields H (M,3), e.g. from equilibrium() over a sweep of the
+  # magnitude or direction of the field. Same units as magnetic_cubic()
+
+  mu0 = 4.0*np.pi*10.0**(-7)
+  ms = ms/mu0
+  k1 = kk1*10.0**6  #J/m^3
+  k2 = kk2*10.0**6  #J/m^3
+  b1 = bb1*10.0**6  # Pa
+  b2 = bb2*10.0**6  # Pa
+  
+  xx = np.asarray(theta, dtype=float).reshape(-1)
+  yy = np.asarray(phi, dtype=float).reshape(-1)
+  hx, hy, hz = np.broadcast_to(np.asarray(H, dtype=float).reshape(-1,3), (len(xx),3)).T
+  
+  ett0=ett(xx,yy,hx,hy,hz,ms,k1,k2)
+  epp0=epp(xx,yy,hx,hy,hz,ms,k1,k2)
+  
+  chizz= (ms**2*np.sin(xx)**2)/ett0
+  chiyz= -(ms**2*np.sin(xx)*np.cos(xx)*np.sin(yy))/(ett0)
+  chixz= -(ms**2*np.sin(xx)*np.cos(xx)*np.cos(yy))/(ett0)
+  chiyy= ms**2*(((np.cos(xx)**2*np.sin(yy)**2)/ett0) + ((np.sin(xx)**2*np.cos(yy)**2)/epp0))
+  chixx= ms**2*(((np.cos(xx)**2*np.cos(yy)**2)/ett0) + ((np.sin(xx)**2*np.sin(yy)**2)/epp0))
+  chixy= -ms**2*(((np.cos(xx)**2*np.cos(yy)*np.sin(yy))/ett0) - ((np.sin(xx)**2*np.cos(yy)*np.sin(yy))/epp0))
+  
+  
+  ax= np.sin(xx)*np.cos(yy)
+  ay= np.sin(xx)*np.sin(yy)
+  az= np.cos(xx)
+  
+  dc11= -(b1/ms)**2*(4.0*chixx*ax**2)  #Pa
+  dc12= -(b1/ms)**2*(4.0*chixy*ax*ay)
+  dc22= -(b1/ms)**2*(4.0*chiyy*ay**2)
+  dc33= -(b1/ms)**2*(4.0*chizz*az**2)
+  dc44= -(b2/ms)**2*(chizz*ay**2 + 2.0*chiyz*ay*az + chiyy*az**2)
+  dc55= -(b2/ms)**2*(chixx*az**2 + chizz*ax**2 + 2.0*chixz*ax*az)
+  dc66= -(b2/ms)**2*(chixx*ay**2 + chiyy*ax**2 + 2.0*chixy*ax*ay)
+  dc13= -(b1/ms)**2*(4.0*chixz*ax*az)
+  dc23= -(b1/ms)**2*(4.0*chiyz*ay*az)
+  dc14= -((2.0*b1*b2)/(ms**2))*(chixy*ax*az + chixz*ax*ay)
+  dc15= -((2.0*b1*b2)/(ms**2))*(chixx*ax*az + chixz*ax*ax)
+  dc16= -((2.0*b1*b2)/(ms**2))*(chixx*ax*ay + chixy*ax*ax)
+  dc24= -((2.0*b1*b2)/(ms**2))*(chiyy*ay*az + chiyz*ay*ay)
+  dc25= -((2.0*b1*b2)/(ms**2))*(chixy*ay*az + chiyz*ax*ay)
+  dc26= -((2.0*b1*b2)/(ms**2))*(chixy*ay*ay + chiyy*ax*ay)
+  dc34= -((2.0*b1*b2)/(ms**2))*(chiyz*az*az + chizz*az*ay)
+  dc35= -((2.0*b1*b2)/(ms**2))*(chixz*az*az + chizz*ax*az)
+  dc36= -((2.0*b1*b2)/(ms**2))*(chixz*ay*az + chiyz*ax*az)
+  dc45= -(b2/ms)**2*(chixy*az**2 + chixz*ay*az + chiyz*ax*az + chizz*ax*ay)
+  dc46= -(b2/ms)**2*(chixy*ay*az + chixz*ay*ay + chiyy*ax*az + chiyz*ax*ay)
+  dc56= -(b2/ms)**2*(chixx*ay*az + chixy*ax*az + chixz*ax*ay + chiyz*ax*ax)
+  
+  dc = voigt66(dc11,dc12,dc13,dc14,dc15,dc16,dc22,dc23,dc24,dc25,dc26,dc33,dc34,dc35,dc36,dc44,dc45,dc46,dc55,dc56,dc66)
+  
+  chi = np.stack((np.stack((chixx,chixy,chixz),axis=-1),
+                  np.stack((chixy,chiyy,chiyz),axis=-1),
+                  np.stack((chixz,chiyz,chizz),axis=-1)),axis=-2)
+  
+  return dc, np.stack((ax,ay,az),axis=-1), chi
+
+def magnetic_hex_batch(theta,phi,H,ms,kk1,kk2,bb21,bb22,bb3,bb4):
+  # magnetoelastic corrections dCij (Pa, (M,6,6)) of a hexagonal I crystal, directions of the
+  # magnetization (M,3) and susceptibility tensors chi (M,3,3), see magnetic_cubic_batch()
+
+  mu0 = 4.0*np.pi*10.0**(-7)
+  ms = ms/mu0
+  k1 = kk1*10.0**6  #J/m^3
+  k2 = kk2*10.0**6  #J/m^3
+  b21 = bb21*10.0**6  # Pa
+  b22 = bb22*10.0**6  # Pa
+  b3 = bb3*10.0**6  # Pa
+  b4 = bb4*10.0**6  # Pa
+  
+  xx = np.asarray(theta, dtype=float).reshape(-1)
+  yy = np.asarray(phi, dtype=float).reshape(-1)
+  hx, hy, hz = np.broadcast_to(np.asarray(H, dtype=float).reshape(-1,3), (len(xx),3)).T
+  
+  ett0=etth(xx,yy,hx,hy,hz,ms,k1,k2)
+  epp0=epph(xx,yy,hx,hy,hz,ms,k1,k2)
+  
+  chizz= (ms**2*np.sin(xx)**2)/ett0
+  chiyz= -(ms**2*np.sin(xx)*np.cos(xx)*np.sin(yy))/(ett0)
+  chixz= -(ms**2*np.sin(xx)*np.cos(xx)*np.cos(yy))/(ett0)
+  chiyy= ms**2*(((np.cos(xx)**2*np.sin(yy)**2)/ett0) + ((np.sin(xx)**2*np.cos(yy)**2)/epp0))
+  chixx= ms**2*(((np.cos(xx)**2*np.cos(yy)**2)/ett0) + ((np.sin(xx)**2*np.sin(yy)**2)/epp0))
+  chixy= -ms**2*(((np.cos(xx)**2*np.cos(yy)*np.sin(yy))/ett0) - ((np.sin(xx)**2*np.cos(yy)*np.sin(yy))/epp0))
+  
+  
+  ax= np.sin(xx)*np.cos(yy)
+  ay= np.sin(xx)*np.sin(yy)
+  az= np.cos(xx)
+  
+  dc11= (1.0/ms)**2*(-b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)+2.0*b21*b3*az*(chiyz*ay-chixz*ax)-chizz*4.0*b21**2*az**2)  #Pa
+  dc22= (1.0/ms)**2*(-b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)-2.0*b21*b3*az*(chiyz*ay-chixz*ax)-chizz*4.0*b21**2*az**2) 
+  dc33= -(b22/ms)**2*(4.0*chizz*az**2)
+  dc44= -(b4/ms)**2*(chizz*ay**2 + chiyz*ay*az + chiyy*az**2)
+  dc55= -(b4/ms)**2*(chixx*az**2 + chizz*ax**2 + chixz*ax*az)
+  dc66= -(b3/ms)**2*(chixx*ay**2 + chiyy*ax**2 + chixy*ax*ay)
+  dc12= (1.0/ms)**2*(b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)-4.0*b21**2*az**2*chizz)
+  dc13= (1.0/ms)**2*(-b22*b3*(chixz*ax*az-chiyz*ay*az)-4.0*chizz*b21*b22*az**2)
+  dc14= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chiyy*ay*az+chixy*ax*az+chixz*ax*ay-chiyz*ay**2)+b21*(4.0*chizz*ay*az+2.0*chiyz*az**2))
+  dc15= -(1.0/ms)**2*(0.5*b4)*(b3*(2.0*chixx*ax*az-chixy*ay*az-chiyz*ax*ay+chixz*ax**2)+b21*(4.0*chizz*ax*az+2.0*chixz*az**2))
+  dc16= -(1.0/ms)**2*(0.5*b3)*(2.0*b3*ax*ay*(chixx-chiyy)+b3*chixy*(ax**2-ay**2)+2.0*b21*az*(ay*chixz+ax*chiyz))
+  dc23= (1.0/ms)**2*(b3*b22*az*(ax*chixz-ay*chiyz)-4.0*b21*b22*az**2*chizz)
+  dc24= -(1.0/ms)**2*(0.5*b4)*(b3*(2.0*chiyy*ay*az-chixy*ax*az-chixz*ax*ay+chiyz*ay**2)+b21*(4.0*chizz*ay*az+2.0*chiyz*az**2))
+  dc25= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chixx*ax*az+chixy*ay*az-chixz*ax**2+chiyz*ax*ay)+b21*(4.0*chizz*ax*az+2.0*chixz*az**2))
+  dc26= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chixx*ay*ax+2.0*chiyy*ax*ay+chixy*ay*ay-chixy*ax**2)+b21*(2.0*chixz*ay*az+2.0*chiyz*az*ax))
+  dc34= -((b22*b4)/(ms**2))*az*(2.0*chizz*ay + az*chiyz)
+  dc35= -((b22*b4)/(ms**2))*az*(2.0*chizz*ax + az*chixz)
+  dc36= -((b22*b3)/(ms**2))*az*(chixz*ay + ax*chiyz)
+  dc45= -0.5*(b4/ms)**2*(chixy*az**2 + chixz*ay*az + chiyz*ax*az + 2.0*chizz*ax*ay)
+  dc46= -0.5*(1.0/ms)**2*b3*b4*(chixy*ay*az + chixz*ay*ay + 2.0*chiyy*ax*az + chiyz*ax*ay)
+  dc56= -0.5*(1.0/ms)**2*b3*b4*(2.0*chixx*ay*az + chixy*ax*az + chixz*ax*ay + chiyz*ax*ax)
+  
+  dc = voigt66(dc11,dc12,dc13,dc14,dc15,dc16,dc22,dc23,dc24,dc25,dc26,dc33,dc34,dc35,dc36,dc44,dc45,dc46,dc55,dc56,dc66)
+  
+  chi = np.stack((np.stack((chixx,chixy,chixz),axis=-1),
+                  np.stack((chixy,chiyy,chiyz),axis=-1),
+                  np.stack((chixz,chiyz,chizz),axis=-1)),axis=-2)
+  
+  return dc, np.stack((ax,ay,az),axis=-1), chi
+
+def unit_directions(N):
+  # (M,3) float64 array of unit wave vectors
+  N = np.asarray(N, dtype=float).reshape(-1, 3)
+  return N/np.linalg.norm(N, axis=1)[:,None]
+
+def group_velocity(C, rho, N):
+  # group velocity (m/s) of the three solutions (qP, qS1, qS2) of the elastic tensor C (Pa, 6x6
+  # or its 21 independent components) and density rho (kg/m^3) along the wave vectors N. Returns
+  # a (3,3,M) array indexed as [solution, component, direction]
+  return vel_batch_sym(voigt21(C)/rho, unit_directions(N))
+
+def velocity_change(C, dC, rho, N):
+  # fractional change (v-v0)/v0 of the sound velocity (3,M) of the three solutions when the
+  # elastic tensor C changes by dC (both in Pa), e.g. the magnetoelastic corrections above
+  N = unit_directions(N)
+  v0 = np.sqrt((group_velocity(C, rho, N)**2).sum(axis=1))
+  v = np.sqrt((group_velocity(voigt21(C) + voigt21(dC), rho, N)**2).sum(axis=1))
+  
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return (v-v0)/v0
+
+############## screening of many crystals
+
+SCREEN_COLUMNS = ['index', 'rho'] + ['%s_%s' % (m, q) for m in ('qP', 'qS1', 'qS2') for q in ('vmin', 'vmax', 'aniso')] + ['AU']
+
+def anisotropy_index(C):
+  # universal elastic anisotropy index AU = 5 GV/GR + KV/KR - 6 from the Voigt and Reuss bulk and
+  # shear moduli (Ranganathan and Ostoja-Starzewski, PRL 101, 055504 (2008)), 0 for isotropic
+  c = np.zeros((6,6))
+  c[np.triu_indices(6)] = voigt21(C)
+  c = c + np.triu(c, 1).T
+  try:
+    s = np.linalg.inv(c)
+  except np.linalg.LinAlgError:
+    return np.nan
+  
+  kv = (c[0,0]+c[1,1]+c[2,2] + 2.0*(c[0,1]+c[0,2]+c[1,2]))/9.0
+  gv = (c[0,0]+c[1,1]+c[2,2] - (c[0,1]+c[0,2]+c[1,2]) + 3.0*(c[3,3]+c[4,4]+c[5,5]))/15.0
+  kr = 1.0/(s[0,0]+s[1,1]+s[2,2] + 2.0*(s[0,1]+s[0,2]+s[1,2]))
+  gr = 15.0/(4.0*(s[0,0]+s[1,1]+s[2,2]) - 4.0*(s[0,1]+s[0,2]+s[1,2]) + 3.0*(s[3,3]+s[4,4]+s[5,5]))
+  
+  return 5.0*gv/gr + kv/kr - 6.0
+
+def screen_shard(index, rho, C, n, surfaces=False):
+  # worker of screen(): SCREEN_COLUMNS of the crystals of one shard and, if requested, their
+  # sound speeds (T,3,M) on the Fibonacci lattice of n wave vectors
+  N = np.array(fibonacci_sphere(n)[0])
+  rows, speeds = [], []
+  
+  for i, r, c in zip(index, rho, C):
+    v = np.sqrt((group_velocity(c, r, N)**2).sum(axis=1))
+    vmin, vmax = v.min(axis=1), v.max(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      figures = np.stack((vmin, vmax, vmax/vmin), axis=1).ravel()
+    rows.append([i, r] + list(figures) + [anisotropy_index(c)])
+    if surfaces:
+      speeds.append(v.astype(np.float32))
+  
+  return index, rows, np.array(speeds)
+
+def screen_done(path, key):
+  # indices of the crystals already in the results file of screen(), dropping a row cut by an
+  # interruption. Returns None for a new file
+  if not os.path.exists(path):
+    return None
+  
+  with open(path) as f:
+    lines = f.read().split('\n')
+  if lines[0] != '# velcrys screen ' + key or lines[1] != ','.join(SCREEN_COLUMNS):
+    raise ValueError('%s was computed for other tensors or number of wave vectors' % path)
+  
+  # the last element is empty or an incomplete row
+  rows = [l for l in lines[2:-1] if len(l.split(',')) == len(SCREEN_COLUMNS)]
+  if len(rows) != len(lines) - 3 or lines[-1]:
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path) or '.', delete=False) as f:
+      f.write('\n'.join(lines[:2] + rows) + '\n')
+    os.replace(f.name, path)
+  
+  return set(int(l.split(',')[0]) for l in rows)
+
+def screen(rho, C, outdir, n=2000, workers=None, shard=16, surfaces=False, log=None):
+  # min/max sound speed and anisotropy of the crystals (rho, C) in Pa, sharded across a pool of
+  # worker processes. Every finished shard is appended to outdir/screen.csv, which is also the
+  # checkpoint: running it again skips the crystals already there. With surfaces=True the sound
+  # speeds of every shard are saved in outdir/speed-<first index>.npy (float32, (T,3,M)) and the
+  # wave vectors in outdir/n.npy
+  
+  os.makedirs(outdir, exist_ok=True)
+  path = os.path.join(outdir, 'screen.csv')
+  key = cache_key(rho, C, n)
+  
+  done = screen_done(path, key)
+  if done is None:
+    with open(path, 'w') as f:
+      f.write('# velcrys screen %s\n%s\n' % (key, ','.join(SCREEN_COLUMNS)))
+    done = set()
+  if surfaces:
+    np.save(os.path.join(outdir, 'n.npy'), fibonacci_sphere(n)[0])
+  
+  todo = np.array([i for i in range(len(C)) if i not in done], dtype=int)
+  shards = [todo[i:i+shard] for i in range(0, len(todo), shard)]
+  count = len(done)
+  
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool, open(path, 'a') as out:
+    jobs = [pool.submit(screen_shard, idx, rho[idx], C[idx], n, surfaces) for idx in shards]
+    for job in concurrent.futures.as_completed(jobs):
+      index, rows, speeds = job.result()
+      if surfaces:
+        name = os.path.join(outdir, 'speed-%d.npy' % index[0])
+        with tempfile.NamedTemporaryFile(dir=outdir, suffix='.npy', delete=False) as f:
+          np.save(f, speeds)
+        os.replace(f.name, name)
+      out.write(''.join('%d,' % r[0] + ','.join('%.10g' % x for x in r[1:]) + '\n' for r in rows))
+      out.flush()
+      os.fsync(out.fileno())
+      count += len(rows)
+      if log:
+        log('%d/%d crystals' % (count, len(C)))
+  
+  return path
+
+def read_tensors(path):
+  # rows of rho (kg/m^3) followed by the 21 independent Cij or the 36 entries of the 6x6 matrix
+  # (GPa). Returns the densities and the (T,21) elastic constants in Pa
+  rows = np.loadtxt(path, ndmin=2)
+  if rows.shape[1] not in (22, 37):
+    raise ValueError('%s: expected 22 or 37 columns (rho and Cij), found %d' % (path, rows.shape[1]))
+  C = np.array([voigt21(c.reshape(6,6) if len(c) == 36 else c) for c in rows[:,1:]])
+  return rows[:,0], C*10**9
+
+def read_corrections(path, count):
+  # count rows of 21 or 36 corrections dCij (GPa), same layout as read_tensors() without rho
+  dC = np.loadtxt(path, ndmin=2)
+  if dC.shape != (count, 21) and dC.shape != (count, 36):
+    raise ValueError('%s: expected %d rows of 21 or 36 dCij' % (path, count))
+  return np.array([voigt21(c.reshape(6,6) if len(c) == 36 else c) for c in dC])*10**9
+
+def main(argv=None):
+  
+  parser = argparse.ArgumentParser(prog='velcrys', description='VelCrys computations without the web interface')
+  commands = parser.add_subparsers(dest='command', required=True)
+  
+  batch = commands.add_parser('batch', help='group velocities of a list of elastic tensors',
+                              description='Writes a .npz file with the wave vectors n (M,3), the densities rho (T,), the elastic '
+                                          'constants C (T,21, Pa), the group velocities v (T,3,3,M, m/s) indexed as '
+                                          '[tensor, solution, component, direction] and their magnitudes speed (T,3,M).')
+  batch.add_argument('tensors', help='text file with one crystal per line: rho (kg/m^3) followed by the 21 independent '
+                                     'Cij (c11 c12 ... c16 c22 ... c66) or the 36 entries of the 6x6 matrix (GPa)')
+  batch.add_argument('directions', nargs='?', help='text file with one wave vector nx ny nz per line '
+                                                   '(default: Fibonacci lattice of N wave vectors)')
+  batch.add_argument('-n', type=int, default=2000, help='number of wave vectors of the Fibonacci lattice (default: 2000)')
+  batch.add_argument('--dc', help='text file with the corrections dCij (GPa) of every crystal, same layout without rho. '
+                                  'Adds the fractional change (v-v0)/v0 of the sound velocity as change (T,3,M)')
+  batch.add_argument('-o', '--output', default='velcrys.npz', help='output file (default: velcrys.npz)')
+  
+  screening = commands.add_parser('screen', help='min/max velocities and anisotropy of many elastic tensors in parallel',
+                                  description='Appends the minimum and maximum sound speed (m/s) of the qP, qS1 and qS2 waves, '
+                                              'their ratio vmax/vmin and the universal anisotropy index AU of every crystal '
+                                              'to OUTDIR/screen.csv as the worker processes finish them. An interrupted run '
+                                              'resumes from that file.')
+  screening.add_argument('tensors', help='text file with one crystal per line, same layout as for batch')
+  screening.add_argument('-o', '--outdir', default='velcrys-screen', help='output directory (default: velcrys-screen)')
+  screening.add_argument('-n', type=int, default=2000, help='number of wave vectors of the Fibonacci lattice (default: 2000)')
+  screening.add_argument('-j', '--workers', type=int, help='number of worker processes (default: number of CPUs)')
+  screening.add_argument('--shard', type=int, default=16, help='crystals per task (default: 16)')
+  screening.add_argument('--surfaces', action='store_true', help='also save the sound speed surfaces (float32 .npy files)')
+  
+  surface = commands.add_parser('surface', help='velocity surface of one elastic tensor in a binary surface file',
+                                description='Writes a memory-mappable surface file (see save_surface() and load_surface() '
+                                            'in velcore.py) with the elastic constants, density, mesh and mode in its '
+                                            'header and the arrays n, v, vx, vy, vz and, with --dc, v0 and (v-v0)/v0.')
+  surface.add_argument('tensors', help='text file with one crystal per line, same layout as for batch')
+  surface.add_argument('-i', '--index', type=int, default=0, help='line of the crystal in the file of tensors (default: 0)')
+  surface.add_argument('--mode', choices=MODES, default='qP', help='solution (default: qP)')
+  surface.add_argument('--mesh', choices=['grid', 'fibonacci'], default='grid', help='θ-φ grid or Fibonacci lattice (default: grid)')
+  surface.add_argument('-n', type=int, default=2000, help='number of wave vectors (default: 2000)')
+  surface.add_argument('--dc', help='text file with the corrections dCij (GPa) of every crystal. The velocities are '
+                                    'computed with C+dC and v0 with C')
+  surface.add_argument('--double', action='store_true', help='float64 arrays (default: float32)')
+  surface.add_argument('-o', '--output', default='surface.vcs', help='output file (default: surface.vcs)')
+  
+  args = parser.parse_args(argv)
+  
+  rho, C = read_tensors(args.tensors)
+  
+  if args.command == 'surface':
+    c, r = C[args.index], rho[args.index]
+    k = MODES.index(args.mode)
+    n = 2*(int(np.sqrt(args.n))//2)+1 if args.mesh == 'grid' else args.n
+    
+    v0 = None
+    if args.dc:
+      try:
+        dc = read_corrections(args.dc, len(C))[args.index]
+      except ValueError as e:
+        parser.error(str(e))
+      vv = surface_modes(tuple(c/r), n, args.mesh)[k]
+      v0 = np.sqrt(vv[0]**2+vv[1]**2+vv[2]**2)
+      c = c + dc
+    
+    save_surface(args.output, c, r, {'type': args.mesh, 'n': n}, args.mode, surface_modes(tuple(c/r), n, args.mesh)[k],
+                 v0=v0, dtype=np.float64 if args.double else np.float32)
+    return 0
+  
+  if args.command == 'screen':
+    try:
+      screen(rho, C, args.outdir, args.n, args.workers, args.shard, args.surfaces,
+             log=lambda msg: print(msg, file=sys.stderr))
+    except ValueError as e:
+      parser.error(str(e))
+    return 0
+  
+  if args.directions:
+    N = unit_directions(np.loadtxt(args.directions, ndmin=2))
+  else:
+    N = np.array(fibonacci_sphere(args.n)[0])
+  
+  v = np.array([group_velocity(c, r, N) for c, r in zip(C, rho)])
+  res = dict(n=N, rho=rho, C=C, v=v, speed=np.sqrt((v**2).sum(axis=2)))
+  
+  if args.dc:
+    try:
+      dC = read_corrections(args.dc, len(C))
+    except ValueError as e:
+      parser.error(str(e))
+    res['change'] = np.array([velocity_change(c, d, r, N) for c, d, r in zip(C, dC, rho)])
+  
+  np.savez(args.output, **res)
+  
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -4,28 +4,56 @@
 # visit http://127.0.0.1:8050/ in your web browser.
 
 import os
+import sys
+import cProfile
+import glob
+import json
+import logging
+import contextlib
+import threading
+import time
+import uuid
+import functools
+import hashlib
+import tempfile
+
+if __name__ == '__main__' and sys.argv[1:2] in (['batch'], ['screen'], ['surface']):
+    # headless batch computations, no Dash or Plotly import (see velcore.main())
+    import velcore
+    sys.exit(velcore.main(sys.argv[1:]))
+
 import dash
+import flask
 #import dash_core_components as dcc
 from dash import dcc
 #import dash_html_components as html
 from dash import html
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
-import mpmath
-import cmath
-from sympy import *
-from dash.dependencies import Input, Output, State
-from scipy.optimize import minimize
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
+from plotly.io.json import to_json_plotly
+from velcore import (CACHE_DIR, remove_quietly, checkpoints, recording, current_record, timed, vel, SOLS, voigt21, surface_modes, fibonacci_sphere, adaptive_sphere, fractional_change,
+                     enecub, enehex, equilibrium, magnetic_cubic, magnetic_hex, magnetic_cubic_batch, magnetic_hex_batch,
+                     MODES, save_surface)
+
+
+try:
+    import diskcache
+    # the 3D plots run as background jobs with a progress bar and a cancel button instead of
+    # blocking a server worker (and hitting its timeout) until they finish
+    manager = dash.DiskcacheManager(diskcache.Cache(os.path.join(CACHE_DIR, 'jobs')))
+except ImportError:
+    manager = None
 
 
-app = dash.Dash(__name__)
+app = dash.Dash(__name__, background_callback_manager=manager)
 
 server = app.server
 
 app.config.suppress_callback_exceptions = True
 
-app.layout = html.Div(children=[
+layout = html.Div(children=[
     html.H1(children='VelCrys: A tool to Compute Sound Velocity in Crystals'),
     html.Hr(),
     html.H5('P. Nieves, J.M. Fernández, R. Iglesias'),
@@ -90,17 +118,19 @@ app.layout = html.Div(children=[
 
 ])
 
-             
 
+def serve_layout():
+    # new session id on every page load, see supersede()
+    return html.Div([layout, dcc.Store(id='session', data=uuid.uuid4().hex),
+                     dcc.Store(id='layouts', data=app.get_relative_path('/_velcrys/layouts/%s/' % LAYOUTS_VERSION))])
 
-@app.callback(
-    dash.dependencies.Output('mode_output', 'children'),
-    [dash.dependencies.Input('mode', 'value'),
-    ])
+app.layout = serve_layout
 
+             
 
 
-def update_landscape(mode):
+def mode_layout(mode):
+  # component tree of a type of calculation, serialized once at startup, see LAYOUTS
 
   if mode == 'numerical': 
     
@@ -257,6 +287,7 @@ def update_landscape(mode):
             html.Div(['C',html.Sub('66'),'(GPa)'" = ",
               dcc.Input(id='c66tric3d', value=150.456, type='number', debounce=True, step=0.001),                    
               ]),
+            dcc.Store(id='tensortric3d'),
             dcc.Markdown(''' **Mass density:**'''),
             html.Div(['\u03C1','(kg/m',html.Sup("3"),')'" = ",
               dcc.Input(id='rhotric3d', value=10000.429, type='number', debounce=True, step=0.001)]),
@@ -274,6 +305,27 @@ def update_landscape(mode):
                 value='sol_1'
             ),
 
+            dcc.Markdown(''' **Sampling of the wave vectors k on the sphere:**'''),
+            dcc.Dropdown(
+                id='meshtric3d',
+                options=[
+                    {'label': 'θ-φ grid of √N x √N wave vectors', 'value': 'grid'},
+                    {'label': 'Quasi-uniform Fibonacci lattice of N wave vectors (same detail with fewer points)', 'value': 'fibonacci'},
+                    {'label': 'Adaptive mesh of N wave vectors refined near cusps and degeneracies', 'value': 'adaptive'},
+                ],
+                value='grid'
+            ),
+
+            dcc.Markdown(''' **Data sent to the browser for the 3D figure:**'''),
+            dcc.Dropdown(
+                id='datatric3d',
+                options=[
+                    {'label': 'Compact: float32 binary arrays, the hover values n, θ and φ are derived in the browser', 'value': 'compact'},
+                    {'label': 'Full: float64 arrays with all the hover values', 'value': 'full'},
+                ],
+                value='compact'
+            ),
+
             html.Div(id='output_tric_3d'),
             
             
@@ -288,7 +340,15 @@ def update_landscape(mode):
 
 
             
-            dcc.Loading(id="ls-loading-tric-3d", children=[dcc.Graph(id='tric_3D')], type="default",fullscreen=False,debug=True),
+            html.Div([html.Progress(id='progresstric3d', value='0', max='100', style={'visibility': 'hidden'}),
+                      html.Button('Cancel', id='canceltric3d', disabled=True)]),
+            dcc.Store(id='stagetric3d'),
+            dcc.Store(id='figuretric3d'),
+            dcc.Loading(id="ls-loading-tric-3d", children=[dcc.Store(id='previewtric3d'), dcc.Graph(id='tric_3D')], type="default",fullscreen=False,debug=True),
+            
+            dcc.Markdown(''' **Save the computed surface** (binary file with the elastic constants, mass density, mesh, wave vectors n and velocities v, vx, vy, vz of the selected solution, see ```load_surface()``` in ```velcore.py```)**:**'''),
+            html.Button('Download surface', id='savetric3d'),
+            dcc.Download(id='filetric3d'),
             
             
 
@@ -561,7 +621,31 @@ def update_landscape(mode):
                 value='sol_1'
             ),
 
+            dcc.Markdown(''' **Sampling of the wave vectors k on the sphere:**'''),
+            dcc.Dropdown(
+                id='meshcf',
+                options=[
+                    {'label': 'θ-φ grid of √N x √N wave vectors', 'value': 'grid'},
+                    {'label': 'Quasi-uniform Fibonacci lattice of N wave vectors (same detail with fewer points)', 'value': 'fibonacci'},
+                ],
+                value='grid'
+            ),
+
+            dcc.Markdown(''' **Data sent to the browser for the 3D figure:**'''),
+            dcc.Dropdown(
+                id='datacf',
+                options=[
+                    {'label': 'Compact: float32 binary arrays, the hover values n, θ and φ are derived in the browser', 'value': 'compact'},
+                    {'label': 'Full: float64 arrays with all the hover values', 'value': 'full'},
+                ],
+                value='compact'
+            ),
+
             html.Div(id='cf'),
+            dcc.Store(id='tensorcf'),
+            dcc.Store(id='stagecf'),
+            dcc.Store(id='previewcf'),
+            dcc.Store(id='v000cf'),
             
             
             
@@ -575,7 +659,9 @@ def update_landscape(mode):
 
 
             
-            dcc.Loading(id="ls-loading-cub-3df", children=[dcc.Graph(id='output_cf')], type="default",fullscreen=False,debug=True),
+            html.Div([html.Progress(id='progresscf', value='0', max='100', style={'visibility': 'hidden'}),
+                      html.Button('Cancel', id='cancelcf', disabled=True)]),
+            dcc.Loading(id="ls-loading-cub-3df", children=[dcc.Store(id='figurecf'), dcc.Graph(id='output_cf')], type="default",fullscreen=False,debug=True),
             
             
       ])
@@ -643,7 +729,31 @@ def update_landscape(mode):
                 value='sol_1'
             ),
 
+            dcc.Markdown(''' **Sampling of the wave vectors k on the sphere:**'''),
+            dcc.Dropdown(
+                id='meshhf',
+                options=[
+                    {'label': 'θ-φ grid of √N x √N wave vectors', 'value': 'grid'},
+                    {'label': 'Quasi-uniform Fibonacci lattice of N wave vectors (same detail with fewer points)', 'value': 'fibonacci'},
+                ],
+                value='grid'
+            ),
+
+            dcc.Markdown(''' **Data sent to the browser for the 3D figure:**'''),
+            dcc.Dropdown(
+                id='datahf',
+                options=[
+                    {'label': 'Compact: float32 binary arrays, the hover values n, θ and φ are derived in the browser', 'value': 'compact'},
+                    {'label': 'Full: float64 arrays with all the hover values', 'value': 'full'},
+                ],
+                value='compact'
+            ),
+
             html.Div(id='hf'),
+            dcc.Store(id='tensorhf'),
+            dcc.Store(id='stagehf'),
+            dcc.Store(id='previewhf'),
+            dcc.Store(id='v000hf'),
             
             
             
@@ -657,13 +767,40 @@ def update_landscape(mode):
 
 
             
-            dcc.Loading(id="ls-loading-hex-3df", children=[dcc.Graph(id='output_hf')], type="default",fullscreen=False,debug=True),
+            html.Div([html.Progress(id='progresshf', value='0', max='100', style={'visibility': 'hidden'}),
+                      html.Button('Cancel', id='cancelhf', disabled=True)]),
+            dcc.Loading(id="ls-loading-hex-3df", children=[dcc.Store(id='figurehf'), dcc.Graph(id='output_hf')], type="default",fullscreen=False,debug=True),
             
             
       ])            
 
 
 
+# JSON of the component trees of the types of calculation, served as static files under a URL
+# that changes with their content, so that the browser downloads each of them once and a change
+# of the mode dropdown is handled in the browser (layout() in assets/velcrys.js) without any
+# callback request
+LAYOUTS = {mode['value']: to_json_plotly(mode_layout(mode['value'])).encode()
+           for mode in layout['mode'].options}
+LAYOUTS_VERSION = hashlib.sha1(b''.join(LAYOUTS[mode] for mode in sorted(LAYOUTS))).hexdigest()[:12]
+
+
+@server.route(app.config.routes_pathname_prefix + '_velcrys/layouts/<version>/<mode>.json')
+def serve_mode_layout(version, mode):
+    if version != LAYOUTS_VERSION or mode not in LAYOUTS:
+        flask.abort(404)
+    response = flask.Response(LAYOUTS[mode], mimetype='application/json')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace='velcrys', function_name='layout'),
+    Output('mode_output', 'children'),
+    [Input('mode', 'value')],
+    [State('layouts', 'data')],
+)
+
 
 ##############Magnetic correction Cubic 
 
@@ -725,63 +862,11 @@ def update_landscape(mode):
 
 def update_magnetic(ms,kk1,kk2,bb1,bb2,hx,hy,hz,cc11,cc12,cc44,kx,ky,kz,rho,sol):
 
-    delta=0.0*10.0**(-5)
-    mu0 = 4.0*np.pi*10.0**(-7)
-    ms = ms/mu0
-    k1 = kk1*10.0**6  #J/m^3
-    k2 = kk2*10.0**6  #J/m^3
-    b1 = bb1*10.0**6  # Pa
-    b2 = bb2*10.0**6  # Pa
-  #  dk1 = ((b1**2)/(c11 - c12)) - ((b2**2)/(2.0*c44))
-  #  k1eff = (k1 + dk1)
-    
-    hx=hx+delta
-    hy=hy+delta
-    hz=hz+delta
-    
-    a = [hx,hy,hz,ms,k1,k2]  
-  
-    x0 = minimize(enecub,np.array([0.2,0.3]),args=(a),method='Nelder-Mead',options={'maxiter': 1000, 'maxfev': 1000, 'disp': True, 'xatol': 0.0000001})
-
-    xx=float(x0.x[0])
-    yy=float(x0.x[1])
-    
-    ett0=ett(xx,yy,hx,hy,hz,ms,k1,k2)
-    epp0=epp(xx,yy,hx,hy,hz,ms,k1,k2)
-    
-    chizz= (ms**2*np.sin(xx)**2)/ett0
-    chiyz= -(ms**2*np.sin(xx)*np.cos(xx)*np.sin(yy))/(ett0)
-    chixz= -(ms**2*np.sin(xx)*np.cos(xx)*np.cos(yy))/(ett0)
-    chiyy= ms**2*(((np.cos(xx)**2*np.sin(yy)**2)/ett0) + ((np.sin(xx)**2*np.cos(yy)**2)/epp0))
-    chixx= ms**2*(((np.cos(xx)**2*np.cos(yy)**2)/ett0) + ((np.sin(xx)**2*np.sin(yy)**2)/epp0))
-    chixy= -ms**2*(((np.cos(xx)**2*np.cos(yy)*np.sin(yy))/ett0) - ((np.sin(xx)**2*np.cos(yy)*np.sin(yy))/epp0))
-    
-    
-    ax= np.sin(xx)*np.cos(yy)
-    ay= np.sin(xx)*np.sin(yy)
-    az= np.cos(xx)
-    
-    dc11= -(b1/ms)**2*(4.0*chixx*ax**2)*10.0**(-9)  #GPa
-    dc12= -(b1/ms)**2*(4.0*chixy*ax*ay)*10.0**(-9)
-    dc22= -(b1/ms)**2*(4.0*chiyy*ay**2)*10.0**(-9)
-    dc33= -(b1/ms)**2*(4.0*chizz*az**2)*10.0**(-9)
-    dc44= -(b2/ms)**2*(chizz*ay**2 + 2.0*chiyz*ay*az + chiyy*az**2)*10.0**(-9)
-    dc55= -(b2/ms)**2*(chixx*az**2 + chizz*ax**2 + 2.0*chixz*ax*az)*10.0**(-9)
-    dc66= -(b2/ms)**2*(chixx*ay**2 + chiyy*ax**2 + 2.0*chixy*ax*ay)*10.0**(-9)
-    dc13= -(b1/ms)**2*(4.0*chixz*ax*az)*10.0**(-9)
-    dc23= -(b1/ms)**2*(4.0*chiyz*ay*az)*10.0**(-9)
-    dc14= -((2.0*b1*b2)/(ms**2))*(chixy*ax*az + chixz*ax*ay)*10.0**(-9)
-    dc15= -((2.0*b1*b2)/(ms**2))*(chixx*ax*az + chixz*ax*ax)*10.0**(-9)
-    dc16= -((2.0*b1*b2)/(ms**2))*(chixx*ax*ay + chixy*ax*ax)*10.0**(-9)
-    dc24= -((2.0*b1*b2)/(ms**2))*(chiyy*ay*az + chiyz*ay*ay)*10.0**(-9)
-    dc25= -((2.0*b1*b2)/(ms**2))*(chixy*ay*az + chiyz*ax*ay)*10.0**(-9)
-    dc26= -((2.0*b1*b2)/(ms**2))*(chixy*ay*ay + chiyy*ax*ay)*10.0**(-9)
-    dc34= -((2.0*b1*b2)/(ms**2))*(chiyz*az*az + chizz*az*ay)*10.0**(-9)
-    dc35= -((2.0*b1*b2)/(ms**2))*(chixz*az*az + chizz*ax*az)*10.0**(-9)
-    dc36= -((2.0*b1*b2)/(ms**2))*(chixz*ay*az + chiyz*ax*az)*10.0**(-9)
-    dc45= -(b2/ms)**2*(chixy*az**2 + chixz*ay*az + chiyz*ax*az + chizz*ax*ay)*10.0**(-9)
-    dc46= -(b2/ms)**2*(chixy*ay*az + chixz*ay*ay + chiyy*ax*az + chiyz*ax*ay)*10.0**(-9)
-    dc56= -(b2/ms)**2*(chixx*ay*az + chixy*ax*az + chixz*ax*ay + chiyz*ax*ax)*10.0**(-9)
+    theta, phi = equilibrium(enecub,[hx,hy,hz],ms,kk1,kk2)
+    dc, alpha = magnetic_cubic_batch(theta,phi,[hx,hy,hz],ms,kk1,kk2,bb1,bb2)[:2]
+    
+    ax,ay,az = alpha[0]
+    dc11,dc12,dc13,dc14,dc15,dc16,dc22,dc23,dc24,dc25,dc26,dc33,dc34,dc35,dc36,dc44,dc45,dc46,dc55,dc56,dc66 = voigt21(dc[0]*10.0**(-9))  #GPa
     
     a11=(cc11*10**9/rho)+(dc11*10**9/rho)
     a12=(cc12*10**9/rho)+(dc12*10**9/rho)
@@ -833,9 +918,10 @@ def update_magnetic(ms,kk1,kk2,bb1,bb2,hx,hy,hz,cc11,cc12,cc44,kx,ky,kz,rho,sol)
     kkz=kz/kk
     
     
-    vvx,vvy,vvz = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kkx,kky,kkz,sol)
+    with timed('velocities', 2):
+        vvx,vvy,vvz = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kkx,kky,kkz,sol)
         
-    vvvx,vvvy,vvvz = vel(a011,a012,a013,a014,a015,a016,a022,a023,a024,a025,a026,a033,a034,a035,a036,a044,a045,a046,a055,a056,a066,kkx,kky,kkz,sol)
+        vvvx,vvvy,vvvz = vel(a011,a012,a013,a014,a015,a016,a022,a023,a024,a025,a026,a033,a034,a035,a036,a044,a045,a046,a055,a056,a066,kkx,kky,kkz,sol)
     
     vx0=vvx
     vy0=vvy
@@ -852,48 +938,6 @@ def update_magnetic(ms,kk1,kk2,bb1,bb2,hx,hy,hz,cc11,cc12,cc44,kx,ky,kz,rho,sol)
   
     return dc11,dc12,dc13,dc14,dc15,dc16,dc22,dc23,dc24,dc25,dc26,dc33,dc34,dc35,dc36,dc44,dc45,dc46,dc55,dc56,dc66,ax,ay,az,vx0,vy0,vz0,v0,vx00,vy00,vz00,v00,v000
 
-def enecub(x,a):
-
-  hx0=a[0]
-  hy0=a[1]
-  hz0=a[2]
-  Ms0=a[3]
-  k1eff0=a[4]
-  k2eff0=a[5]
-  theta=x[0]
-  phi=x[1]
-  
-  return k1eff0*(((np.sin(theta)*np.cos(phi))**2)*(np.sin(theta)*np.sin(phi))**2 + ((np.sin(theta)*np.cos(phi))**2)*np.cos(theta)**2 + (np.sin(theta)*np.sin(phi))**2*np.cos(theta)**2) + k2eff0*((np.sin(theta)*np.cos(phi))**2)*(np.sin(theta)*np.sin(phi))**2*np.cos(theta)**2 - Ms0*(np.sin(theta)*np.cos(phi)*hx0 + np.sin(theta)*np.sin(phi)*hy0 + np.cos(theta)*hz0)
-
-
-
-def ett(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
-  
-  ff0 = -0.5*ms*(-hhz*np.cos(x) - hhx*np.cos(y)*np.sin(x) - hhy*np.sin(x)*np.sin(y))
-  ff1 = kk1eff*(2.0*np.cos(x)**4*np.cos(y)**2 - 12.0*np.cos(x)**2*np.cos(y)**2*np.sin(x)**2 + 2.0*np.cos(y)**2*np.sin(x)**4 + 2.0*np.cos(x)**4*np.sin(y)**2 - 12.0*np.cos(x)**2*np.sin(x)**2*np.sin(y)**2 + 12.0*np.cos(x)**2*np.cos(y)**2*np.sin(x)**2*np.sin(y)**2 + 2.0*np.sin(x)**4*np.sin(y)**2 - 4.0*np.cos(y)**2*np.sin(x)**4*np.sin(y)**2)
-  ff2 = kk2eff*(12.0*np.cos(x)**4*np.cos(y)**2*np.sin(x)**2*np.sin(y)**2 - 22.0*np.cos(x)**2*np.cos(y)**2*np.sin(x)**4*np.sin(y)**2 + 2.0*np.cos(y)**2*np.sin(x)**6*np.sin(y)**2)
-     
-
-  
-  ff=ff0+ff1+ff2 
-     
-  return ff
-     
-  
-def epp(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
-  ff0 = -0.5*ms*(-hhx*np.cos(y)*np.sin(x) - hhy*np.sin(x)*np.sin(y)) 
-  
-  ff1=kk1eff*(2.0*np.cos(y)**4*np.sin(x)**4 - 12.0*np.cos(y)**2*np.sin(x)**4*np.sin(y)**2 + 2.0*np.sin(x)**4*np.sin(y)**4)
-  
-  ff2=kk2eff*(2.0*np.cos(x)**2*np.cos(y)**4*np.sin(x)**4 - 12.0*np.cos(x)**2*np.cos(y)**2*np.sin(x)**4*np.sin(y)**2 + 2.0*np.cos(x)**2*np.sin(x)**4*np.sin(y)**4)
-
-  ff=ff0+ff1+ff2  
-     
-  return ff
-
-
-
-
 ##############Magnetic correction hex 
 
 @app.callback(
@@ -958,63 +1002,11 @@ def epp(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
 
 def update_magnetic_hex(ms,kk1,kk2,bb21,bb22,bb3,bb4,hx,hy,hz,cc11,cc12,cc13,cc33,cc44,kx,ky,kz,rho,sol):
 
-    delta=0.0*10.0**(-5)
-    mu0 = 4.0*np.pi*10.0**(-7)
-    ms = ms/mu0
-    k1 = kk1*10.0**6  #J/m^3
-    k2 = kk2*10.0**6  #J/m^3
-    b21 = bb21*10.0**6  # Pa
-    b22 = bb22*10.0**6  # Pa
-    b3 = bb3*10.0**6  # Pa
-    b4 = bb4*10.0**6  # Pa
-    
-    hx=hx+delta
-    hy=hy+delta
-    hz=hz+delta
-    
-    a = [hx,hy,hz,ms,k1,k2]  
-  
-    x0 = minimize(enehex,np.array([0.2,0.3]),args=(a),method='Nelder-Mead',options={'maxiter': 1000, 'maxfev': 1000, 'disp': True, 'xatol': 0.0000001})
-
-    xx=float(x0.x[0])
-    yy=float(x0.x[1])
-    
-    ett0=etth(xx,yy,hx,hy,hz,ms,k1,k2)
-    epp0=epph(xx,yy,hx,hy,hz,ms,k1,k2)
-    
-    chizz= (ms**2*np.sin(xx)**2)/ett0
-    chiyz= -(ms**2*np.sin(xx)*np.cos(xx)*np.sin(yy))/(ett0)
-    chixz= -(ms**2*np.sin(xx)*np.cos(xx)*np.cos(yy))/(ett0)
-    chiyy= ms**2*(((np.cos(xx)**2*np.sin(yy)**2)/ett0) + ((np.sin(xx)**2*np.cos(yy)**2)/epp0))
-    chixx= ms**2*(((np.cos(xx)**2*np.cos(yy)**2)/ett0) + ((np.sin(xx)**2*np.sin(yy)**2)/epp0))
-    chixy= -ms**2*(((np.cos(xx)**2*np.cos(yy)*np.sin(yy))/ett0) - ((np.sin(xx)**2*np.cos(yy)*np.sin(yy))/epp0))
-    
-    
-    ax= np.sin(xx)*np.cos(yy)
-    ay= np.sin(xx)*np.sin(yy)
-    az= np.cos(xx)
-    
-    dc11= (1.0/ms)**2*(-b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)+2.0*b21*b3*az*(chiyz*ay-chixz*ax)-chizz*4.0*b21**2*az**2)*10.0**(-9)  #GPa
-    dc22= (1.0/ms)**2*(-b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)-2.0*b21*b3*az*(chiyz*ay-chixz*ax)-chizz*4.0*b21**2*az**2)*10.0**(-9)  
-    dc33= -(b22/ms)**2*(4.0*chizz*az**2)*10.0**(-9) 
-    dc44= -(b4/ms)**2*(chizz*ay**2 + chiyz*ay*az + chiyy*az**2)*10.0**(-9)
-    dc55= -(b4/ms)**2*(chixx*az**2 + chizz*ax**2 + chixz*ax*az)*10.0**(-9)
-    dc66= -(b3/ms)**2*(chixx*ay**2 + chiyy*ax**2 + chixy*ax*ay)*10.0**(-9)
-    dc12= (1.0/ms)**2*(b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)-4.0*b21**2*az**2*chizz)*10.0**(-9)
-    dc13= (1.0/ms)**2*(-b22*b3*(chixz*ax*az-chiyz*ay*az)-4.0*chizz*b21*b22*az**2)*10.0**(-9)
-    dc14= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chiyy*ay*az+chixy*ax*az+chixz*ax*ay-chiyz*ay**2)+b21*(4.0*chizz*ay*az+2.0*chiyz*az**2))*10.0**(-9)
-    dc15= -(1.0/ms)**2*(0.5*b4)*(b3*(2.0*chixx*ax*az-chixy*ay*az-chiyz*ax*ay+chixz*ax**2)+b21*(4.0*chizz*ax*az+2.0*chixz*az**2))*10.0**(-9)
-    dc16= -(1.0/ms)**2*(0.5*b3)*(2.0*b3*ax*ay*(chixx-chiyy)+b3*chixy*(ax**2-ay**2)+2.0*b21*az*(ay*chixz+ax*chiyz))*10.0**(-9)
-    dc23= (1.0/ms)**2*(b3*b22*az*(ax*chixz-ay*chiyz)-4.0*b21*b22*az**2*chizz)*10.0**(-9)
-    dc24= -(1.0/ms)**2*(0.5*b4)*(b3*(2.0*chiyy*ay*az-chixy*ax*az-chixz*ax*ay+chiyz*ay**2)+b21*(4.0*chizz*ay*az+2.0*chiyz*az**2))*10.0**(-9)
-    dc25= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chixx*ax*az+chixy*ay*az-chixz*ax**2+chiyz*ax*ay)+b21*(4.0*chizz*ax*az+2.0*chixz*az**2))*10.0**(-9)
-    dc26= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chixx*ay*ax+2.0*chiyy*ax*ay+chixy*ay*ay-chixy*ax**2)+b21*(2.0*chixz*ay*az+2.0*chiyz*az*ax))*10.0**(-9)
-    dc34= -((b22*b4)/(ms**2))*az*(2.0*chizz*ay + az*chiyz)*10.0**(-9)
-    dc35= -((b22*b4)/(ms**2))*az*(2.0*chizz*ax + az*chixz)*10.0**(-9)
-    dc36= -((b22*b3)/(ms**2))*az*(chixz*ay + ax*chiyz)*10.0**(-9)
-    dc45= -0.5*(b4/ms)**2*(chixy*az**2 + chixz*ay*az + chiyz*ax*az + 2.0*chizz*ax*ay)*10.0**(-9)
-    dc46= -0.5*(1.0/ms)**2*b3*b4*(chixy*ay*az + chixz*ay*ay + 2.0*chiyy*ax*az + chiyz*ax*ay)*10.0**(-9)
-    dc56= -0.5*(1.0/ms)**2*b3*b4*(2.0*chixx*ay*az + chixy*ax*az + chixz*ax*ay + chiyz*ax*ax)*10.0**(-9)
+    theta, phi = equilibrium(enehex,[hx,hy,hz],ms,kk1,kk2)
+    dc, alpha = magnetic_hex_batch(theta,phi,[hx,hy,hz],ms,kk1,kk2,bb21,bb22,bb3,bb4)[:2]
+    
+    ax,ay,az = alpha[0]
+    dc11,dc12,dc13,dc14,dc15,dc16,dc22,dc23,dc24,dc25,dc26,dc33,dc34,dc35,dc36,dc44,dc45,dc46,dc55,dc56,dc66 = voigt21(dc[0]*10.0**(-9))  #GPa
     
     
     a11=(cc11*10**9/rho)+(dc11*10**9/rho)
@@ -1067,9 +1059,10 @@ def update_magnetic_hex(ms,kk1,kk2,bb21,bb22,bb3,bb4,hx,hy,hz,cc11,cc12,cc13,cc3
     kkz=kz/kk
     
     
-    vvx,vvy,vvz = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kkx,kky,kkz,sol)
+    with timed('velocities', 2):
+        vvx,vvy,vvz = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kkx,kky,kkz,sol)
         
-    vvvx,vvvy,vvvz = vel(a011,a012,a013,a014,a015,a016,a022,a023,a024,a025,a026,a033,a034,a035,a036,a044,a045,a046,a055,a056,a066,kkx,kky,kkz,sol)
+        vvvx,vvvy,vvvz = vel(a011,a012,a013,a014,a015,a016,a022,a023,a024,a025,a026,a033,a034,a035,a036,a044,a045,a046,a055,a056,a066,kkx,kky,kkz,sol)
     
     vx0=vvx
     vy0=vvy
@@ -1087,47 +1080,6 @@ def update_magnetic_hex(ms,kk1,kk2,bb21,bb22,bb3,bb4,hx,hy,hz,cc11,cc12,cc13,cc3
   
     return dc11,dc12,dc13,dc14,dc15,dc16,dc22,dc23,dc24,dc25,dc26,dc33,dc34,dc35,dc36,dc44,dc45,dc46,dc55,dc56,dc66,ax,ay,az,vx0,vy0,vz0,v0,vx00,vy00,vz00,v00,v000
 
-def enehex(x,a):
-
-  hx0=a[0]
-  hy0=a[1]
-  hz0=a[2]
-  Ms0=a[3]
-  k1eff0=a[4]
-  k2eff0=a[5]
-  theta=x[0]
-  phi=x[1]
-  
-  return k1eff0*(1-np.cos(theta)**2) + k2eff0**(1-np.cos(theta)**2)**2 - Ms0*(np.sin(theta)*np.cos(phi)*hx0 + np.sin(theta)*np.sin(phi)*hy0 + np.cos(theta)*hz0)
-
-
-
-def etth(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
-  
-  ff0 = -0.5*ms*(-hhz*np.cos(x) - hhx*np.cos(y)*np.sin(x) - hhy*np.sin(x)*np.sin(y))
-  ff1 = 2.0*kk1eff*(np.cos(x)**2 - np.sin(x)**2)
-  ff2 = kk2eff*(4.0*np.cos(x)**2*(1.0 - np.cos(x)*2) + 8.0*np.cos(x)**2*np.sin(x)**2 - 4.0*(1.0 - np.cos(x)**2)*np.sin(x)**2)
-     
-
-  
-  ff=ff0+ff1+ff2 
-     
-  return ff
-     
-  
-def epph(x,y,hhx,hhy,hhz,ms,kk1eff,kk2eff):
-  ff0 = -0.5*ms*(-hhx*np.cos(y)*np.sin(x) - hhy*np.sin(x)*np.sin(y)) 
-  
-  ff1=0.0
-  
-  ff2=0.0
-
-  ff=ff0+ff1+ff2  
-     
-  return ff
-
-
-
 ##############wang numerical
 
 @app.callback(
@@ -1198,7 +1150,8 @@ def update_numerical_tric(cc11,cc12,cc13,cc14,cc15,cc16,cc22,cc23,cc24,cc25,cc26
     kkz=kz/kk
     
     
-    vx0,vy0,vz0 = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kkx,kky,kkz,sol)
+    with timed('velocities', 1):
+        vx0,vy0,vz0 = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kkx,kky,kkz,sol)
     
 
     v0=np.sqrt(vx0**2+vy0**2+vz0**2)
@@ -1211,10 +1164,11 @@ def update_numerical_tric(cc11,cc12,cc13,cc14,cc15,cc16,cc22,cc23,cc24,cc25,cc26
 
 
 
-############## Wang_method_3D_plot
+############## elastic tensors of the 3D plots (assets/velcrys.js)
 
-@app.callback(
-    Output('tric_3D', 'figure'),
+app.clientside_callback(
+    ClientsideFunction(namespace='velcrys', function_name='triclinic'),
+    Output('tensortric3d', 'data'),
     [Input(component_id='c11tric3d', component_property='value'),
      Input(component_id='c12tric3d', component_property='value'),
      Input(component_id='c13tric3d', component_property='value'),
@@ -1236,88 +1190,524 @@ def update_numerical_tric(cc11,cc12,cc13,cc14,cc15,cc16,cc22,cc23,cc24,cc25,cc26
      Input(component_id='c55tric3d', component_property='value'),
      Input(component_id='c56tric3d', component_property='value'),
      Input(component_id='c66tric3d', component_property='value'),
-     Input(component_id='rhotric3d', component_property='value'),
-     Input(component_id='ntric3d', component_property='value'),
-     Input(component_id='soltric3d', component_property='value'),
     ],
+)
 
+app.clientside_callback(
+    ClientsideFunction(namespace='velcrys', function_name='cubic'),
+    Output('tensorcf', 'data'),
+    [Input(component_id='c11cf', component_property='value'),
+     Input(component_id='c12cf', component_property='value'),
+     Input(component_id='c44cf', component_property='value'),
+    ],
 )
 
+app.clientside_callback(
+    ClientsideFunction(namespace='velcrys', function_name='hexagonal'),
+    Output('tensorhf', 'data'),
+    [Input(component_id='c11hf', component_property='value'),
+     Input(component_id='c12hf', component_property='value'),
+     Input(component_id='c13hf', component_property='value'),
+     Input(component_id='c33hf', component_property='value'),
+     Input(component_id='c44hf', component_property='value'),
+    ],
+)
 
-def update_tric3d(cc11,cc12,cc13,cc14,cc15,cc16,cc22,cc23,cc24,cc25,cc26,cc33,cc34,cc35,cc36,cc44,cc45,cc46,cc55,cc56,cc66,rho,nn,sol):
+############## instrumentation (VELCRYS_METRICS=1)
+
+# wall time of the stages of the computations (see timed() in velcore.py), wave vectors evaluated
+# and payload bytes of every callback request, exported in the Prometheus text format by /metrics
+# and written to the log as one JSON line per request. The totals of every process (server
+# workers and background jobs) are kept in METRICS_DIR
+METRICS = os.environ.get('VELCRYS_METRICS', '') not in ('', '0')
+METRICS_DIR = os.path.join(CACHE_DIR, 'metrics')
+
+log = logging.getLogger('velcrys')
+if METRICS and not log.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+totals = {}
+totals_lock = threading.Lock()
+
+def merge_totals(res, new):
+  # adds the totals new to res: {kind: {callback: {'count', 'seconds', 'bytes', 'stages': {stage: {...}}}}}
+  for kind, callbacks in new.items():
+    for callback, t in callbacks.items():
+      r = res.setdefault(kind, {}).setdefault(callback, {'count': 0, 'seconds': 0.0, 'bytes': 0, 'stages': {}})
+      for k in ('count', 'seconds', 'bytes'):
+        r[k] += t[k]
+      for stage, st in t['stages'].items():
+        rs = r['stages'].setdefault(stage, {'seconds': 0.0, 'calls': 0, 'points': 0})
+        for k in ('seconds', 'calls', 'points'):
+          rs[k] += st[k]
+  return res
+
+def record_metrics(kind, callback, seconds, record, payload=0):
+  # adds a callback request or background job to the totals of the process and logs it
+  seconds = round(seconds, 6)
+  other = max(seconds - sum(st['seconds'] for st in record.values()), 0.0)
+  stages = dict(record, other={'seconds': other, 'calls': 1, 'points': 0})
+  with totals_lock:
+    merge_totals(totals, {kind: {callback: {'count': 1, 'seconds': seconds, 'bytes': payload, 'stages': stages}}})
+    try:
+      os.makedirs(METRICS_DIR, exist_ok=True)
+      path = os.path.join(METRICS_DIR, '%d.json' % os.getpid())
+      with open(path + '.tmp', 'w') as f:
+        json.dump(totals, f)
+      os.replace(path + '.tmp', path)
+    except OSError:
+      pass
+  log.info(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'kind': kind, 'callback': callback, 'seconds': seconds,
+                       'points': sum(st['points'] for st in record.values()), 'bytes': payload,
+                       'stages': {stage: round(st['seconds'], 6) for stage, st in stages.items()}}))
+
+def read_totals():
+  # totals of all the processes. Those of the finished processes are merged into done.json
+  res, done = {}, {}
+  os.makedirs(METRICS_DIR, exist_ok=True)
+  with open(os.path.join(METRICS_DIR, 'lock'), 'w') as lock:
+    if fcntl is not None:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+    paths = glob.glob(os.path.join(METRICS_DIR, '*.json'))
+    for path in paths:
+      name = os.path.basename(path)[:-5]
+      try:
+        with open(path) as f:
+          data = json.load(f)
+      except (OSError, ValueError):
+        continue
+      if name == 'done':
+        merge_totals(done, data)
+      elif name.isdigit():
+        try:
+          os.kill(int(name), 0)
+        except ProcessLookupError:
+          merge_totals(done, data)
+          os.remove(path)
+          continue
+        except OSError:
+          pass
+        merge_totals(res, data)
+    with open(os.path.join(METRICS_DIR, 'done.json.tmp'), 'w') as f:
+      json.dump(done, f)
+    os.replace(f.name, os.path.join(METRICS_DIR, 'done.json'))
+  return merge_totals(res, done)
+
+def callback_name(output):
+  # name of the function of a callback from the output of a request
+  cb = app.callback_map.get(output, {}).get('callback')
+  return getattr(cb, '__name__', output)
+
+if METRICS:
+
+    @server.before_request
+    def start_metrics():
+        if flask.request.path.endswith('/_dash-update-component'):
+            flask.g.velcrys_metrics = (time.perf_counter(), recording({}))
+            flask.g.velcrys_metrics[1].__enter__()
+
+    @server.after_request
+    def record_request(response):
+        if 'velcrys_metrics' in flask.g:
+            start = flask.g.velcrys_metrics[0]
+            output = (flask.request.get_json(silent=True) or {}).get('output', '')
+            record_metrics('request', callback_name(output), time.perf_counter() - start, current_record(),
+                           response.calculate_content_length() or 0)
+        return response
+
+    @server.teardown_request
+    def stop_metrics(exc):
+        metrics = flask.g.pop('velcrys_metrics', None)
+        if metrics is not None:
+            metrics[1].__exit__(None, None, None)
+
+    @server.route('/metrics')
+    def metrics():
+        # local endpoint, not served through a proxy or to other hosts
+        if flask.request.remote_addr not in ('127.0.0.1', '::1') or flask.request.headers.get('X-Forwarded-For'):
+            flask.abort(403)
+        
+        res = read_totals()
+        lines = []
+        def family(name, kind, doc, samples):
+            lines.extend(['# HELP velcrys_%s %s' % (name, doc), '# TYPE velcrys_%s %s' % (name, kind)])
+            for labels, value in samples:
+                lines.append('velcrys_%s{%s} %s' % (name, ','.join('%s="%s"' % kv for kv in labels), repr(float(value))))
+        
+        calls = [(kind, cb, t) for kind, callbacks in sorted(res.items()) for cb, t in sorted(callbacks.items())]
+        family('callback_total', 'counter', 'Callback requests and background jobs',
+               [((('callback', cb), ('kind', kind)), t['count']) for kind, cb, t in calls])
+        family('callback_seconds_total', 'counter', 'Wall time of the callback requests and background jobs',
+               [((('callback', cb), ('kind', kind)), t['seconds']) for kind, cb, t in calls])
+        family('callback_payload_bytes_total', 'counter', 'Bytes of the responses of the callback requests',
+               [((('callback', cb),), t['bytes']) for kind, cb, t in calls if kind == 'request'])
+        stages = [(kind, cb, stage, st) for kind, cb, t in calls for stage, st in sorted(t['stages'].items())]
+        family('stage_seconds_total', 'counter', 'Wall time of the stages of the callbacks, excluding the nested stages',
+               [((('callback', cb), ('kind', kind), ('stage', stage)), st['seconds']) for kind, cb, stage, st in stages])
+        family('stage_calls_total', 'counter', 'Calls of the stages of the callbacks',
+               [((('callback', cb), ('kind', kind), ('stage', stage)), st['calls']) for kind, cb, stage, st in stages])
+        family('stage_points_total', 'counter', 'Wave vectors evaluated by the stages of the callbacks',
+               [((('callback', cb), ('kind', kind), ('stage', stage)), st['points']) for kind, cb, stage, st in stages if st['points']])
+        
+        return flask.Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+############## profiling of the slow callbacks (VELCRYS_PROFILE=seconds)
+
+# every callback request and background job is profiled with cProfile, and those lasting more than
+# VELCRYS_PROFILE seconds are saved to PROFILE_DIR: the profile (.prof, see pstats or snakeviz) and
+# the callback and its input values (.json) to reproduce it. Only the newest PROFILE_KEEP are kept
+PROFILE = float(os.environ['VELCRYS_PROFILE']) if os.environ.get('VELCRYS_PROFILE') else None
+PROFILE_DIR = os.environ.get('VELCRYS_PROFILE_DIR', os.path.join(CACHE_DIR, 'profiles'))
+PROFILE_KEEP = int(os.environ.get('VELCRYS_PROFILE_KEEP', 20))
+
+profiled = threading.local()
+
+@contextlib.contextmanager
+def profiling(callback, inputs):
+  # profiles the block unless it is already profiled by the current thread (e.g. a callback run by
+  # a request); inputs is called for the input values of a slow callback
+  if PROFILE is None or getattr(profiled, 'pid', None) == os.getpid():
+    yield
+    return
+  
+  profiler = cProfile.Profile()
+  try:
+    profiler.enable()
+  except ValueError:
+    # another profiler is active (Python >= 3.12)
+    yield
+    return
+  
+  profiled.pid = os.getpid()
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    profiler.disable()
+    profiled.pid = None
+    seconds = time.perf_counter() - start
+    if seconds >= PROFILE:
+      save_profile(profiler, callback(), inputs(), seconds)
+
+def save_profile(profiler, callback, inputs, seconds):
+  name = '%s-%s-%s' % (time.strftime('%Y%m%d-%H%M%S'), callback, uuid.uuid4().hex[:8])
+  try:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name + '.prof'))
+    with open(os.path.join(PROFILE_DIR, name + '.json'), 'w') as f:
+      json.dump({'callback': callback, 'seconds': round(seconds, 6), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'pid': os.getpid(), 'inputs': inputs}, f, default=repr)
+    
+    # newest PROFILE_KEEP profiles
+    for old in sorted(glob.glob(os.path.join(PROFILE_DIR, '*.prof')))[:-PROFILE_KEEP or None]:
+      for path in (old, old[:-5] + '.json'):
+        if os.path.exists(path):
+          os.remove(path)
+  except OSError as e:
+    log.warning('profile of %s not saved: %s', callback, e)
+
+def request_inputs():
+  # input values of a callback request by component property
+  body = flask.request.get_json(silent=True) or {}
+  return {'%s.%s' % (i.get('id'), i.get('property')): i.get('value')
+          for i in body.get('inputs', []) + body.get('state', []) if isinstance(i, dict)}
+
+if PROFILE is not None:
+
+    @server.before_request
+    def start_profile():
+        if flask.request.path.endswith('/_dash-update-component'):
+            output = lambda: callback_name((flask.request.get_json(silent=True) or {}).get('output', ''))
+            flask.g.velcrys_profile = profiling(output, request_inputs)
+            flask.g.velcrys_profile.__enter__()
+
+    @server.teardown_request
+    def stop_profile(exc):
+        profile = flask.g.pop('velcrys_profile', None)
+        if profile is not None:
+            profile.__exit__(None, None, None)
+
+############## 3D figures sent in the compact mode (assets/velcrys.js)
+
+for mode, graph in (('cf', 'output_cf'), ('hf', 'output_hf')):
+    app.clientside_callback(
+        ClientsideFunction(namespace='velcrys', function_name='figure'),
+        Output(graph, 'figure'),
+        [Input('figure'+mode, 'data')],
+    )
+
+app.clientside_callback(
+    ClientsideFunction(namespace='velcrys', function_name='staged'),
+    Output('tric_3D', 'figure'),
+    [Input('figuretric3d', 'data'),
+     Input('previewtric3d', 'data')],
+)
+
+############## Wang_method_3D_plot
 
+def background(mode):
+  # app.callback() arguments of the 3D plot of a mode running as a background job (with diskcache
+  # installed): progress bar and cancel button. A job whose inputs change is not cancelled here,
+  # with_progress() stops it at its next checkpoint once the newer request arrives (supersede())
+  if manager is None:
+    return {}
+  return dict(background=True, interval=500,
+              progress=[Output('progress'+mode, 'value'), Output('progress'+mode, 'max')],
+              running=[(Output('progress'+mode, 'style'), {'visibility': 'visible'}, {'visibility': 'hidden'}),
+                       (Output('cancel'+mode, 'disabled'), False, True)],
+              cancel=[Input('cancel'+mode, 'n_clicks')])
+
+SESSION_DIR = os.path.join(CACHE_DIR, 'sessions')
+# time of the last removal of the old sessions by this process, done at most once an hour
+swept = 0.0
+
+class Superseded(Exception):
+  pass
+
+def supersede(session, name):
+  # registers a new request of the callback name from the browser session (shared by all the
+  # server workers through SESSION_DIR) and returns the hook for checkpoints() that aborts its
+  # computation with Superseded between two chunks once a newer request of the session arrives
+  if not isinstance(session, str) or len(session) != 32 or not set(session) <= set('0123456789abcdef'):
+    return None
+  
+  path = os.path.join(SESSION_DIR, '%s-%s' % (session, name))
+  version = uuid.uuid4().hex
+  try:
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    with open('%s.%s' % (path, version), 'w') as f:
+      f.write(version)
+    os.replace(f.name, path)
+  except OSError:
+    return None
+  
+  # versions of the sessions closed more than a day ago
+  global swept
+  if time.time() - swept > 3600:
+    swept = time.time()
+    for old in glob.glob(os.path.join(SESSION_DIR, '*')):
+      try:
+        if os.path.getmtime(old) < swept - 86400:
+          os.remove(old)
+      except OSError:
+        pass
+  
+  def hook(done, total):
+    try:
+      with open(path) as f:
+        latest = f.read()
+    except OSError:
+      return
+    if latest != version:
+      raise Superseded()
+  
+  return hook
+
+def with_progress(func):
+  # runs a 3D plot callback, whose last argument is the session id, aborting it when a newer
+  # request of the same session supersedes it and reporting the wave vectors evaluated (see
+  # checkpoints()) to the progress bar. Dash passes set_progress as first argument to the
+  # background callbacks only
+  @functools.wraps(func)
+  def wrapper(*args):
+    set_progress = None
+    if manager is not None:
+      set_progress, args = args[0], args[1:]
+    args, session = args[:-1], args[-1]
+    
+    hooks = [supersede(session, func.__name__)]
+    if set_progress is not None:
+      hooks.append(lambda done, total: set_progress((str(done), str(total))))
+    hooks = [h for h in hooks if h is not None]
+    
+    def hook(done, total):
+      for h in hooks:
+        h(done, total)
+    
+    record = None
+    if METRICS and current_record() is None:
+      record, start = {}, time.perf_counter()
+    
+    inputs = lambda: dict(zip(func.__code__.co_varnames, args), session=session)
+    
+    try:
+      with recording(record) if record is not None else contextlib.nullcontext(), profiling(lambda: func.__name__, inputs):
+        with checkpoints(hook if hooks else None):
+          return func(*args)
+    except Superseded:
+      raise PreventUpdate
+    finally:
+      if record is not None:
+        record_metrics('job', func.__name__, time.perf_counter() - start, record)
+  return wrapper
+
+# level of detail: the 3D plots first show a preview computed with 1/PREVIEW of the N wave
+# vectors, replaced by the full surface once computed (second stage of the callbacks)
+PREVIEW = int(os.environ.get('VELCRYS_PREVIEW', 16))
+
+def preview(nn):
+  # whether the plot of N wave vectors is previewed (at least 100 wave vectors in the preview)
+  return PREVIEW > 1 and isinstance(nn, (int, float)) and int(nn)//PREVIEW >= 100
+
+# wave vectors of the 3D figures: every array of a figure is as long as N and the browser cannot
+# draw many more, so a larger N is plotted with PLOT_POINTS (the saved surfaces keep N)
+PLOT_POINTS = int(os.environ.get('VELCRYS_PLOT_POINTS', 10**6))
+
+def plotted(nn):
+  return min(int(nn), PLOT_POINTS)
+
+# v000 of the stages of the fractional change plots, kept on the disk of the server (shared by the
+# workers and the background jobs) apart from the surface cache, so that they neither evict the
+# surfaces nor depend on VELCRYS_CACHE_SIZE. Only their key goes through the browser, the least
+# recently used are removed beyond STAGE_BYTES
+STAGE_DIR = os.path.join(CACHE_DIR, 'stages')
+STAGE_BYTES = int(os.environ.get('VELCRYS_STAGE_BYTES', 2**28))
+
+def kept(stage, change, args):
+  # store of the fractional change change(*args) (cf_change or hf_change) of a stage
+  v000 = np.asarray(change(*args), dtype=float)
+  key = uuid.uuid4().hex
+  os.makedirs(STAGE_DIR, exist_ok=True)
+  fd, tmp = tempfile.mkstemp(dir=STAGE_DIR, prefix=key+'.', suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      np.save(f, v000)
+    os.replace(tmp, os.path.join(STAGE_DIR, key + '.npy'))
+  except BaseException:
+    remove_quietly(tmp)
+    raise
+  
+  # the oldest stages beyond STAGE_BYTES (but this one) and the temporary files of killed processes
+  stat = {}
+  for f in glob.glob(os.path.join(STAGE_DIR, '*')):
+    try:
+      stat[f] = os.stat(f)
+    except OSError:
+      pass
+  size = 0
+  for f in sorted(stat, key=lambda f: stat[f].st_mtime, reverse=True):
+    size += stat[f].st_size
+    if f.endswith('.tmp'):
+      if stat[f].st_mtime < time.time() - 86400:
+        remove_quietly(f)
+    elif size > STAGE_BYTES and os.path.basename(f) != key + '.npy':
+      remove_quietly(f)
+  
+  return {'stage': stage, 'key': key}
+
+def staged(preview, full):
+  # v000 of the latest stage of a fractional change plot: the full result once computed for the
+  # stage of the preview, the preview until then. Not updated if it is no longer stored
+  if preview is None:
+    raise PreventUpdate
+  if full is not None and full['stage'] == preview['stage']:
+    store = full
+  elif preview['key'] is None:
+    raise PreventUpdate
+  else:
+    store = preview
+  path = os.path.join(STAGE_DIR, store['key'] + '.npy')
+  try:
+    v000 = np.load(path, mmap_mode='r')
+    os.utime(path)
+  except (OSError, ValueError):
+    raise PreventUpdate
+  return v000
+
+def compact(meta, **arrays):
+  # trace arrays of a 3D plot in the compact mode: float32 (int32 for the triangles) that plotly
+  # sends as binary typed arrays, without the hover values derived from the surface (|v|, n, θ and
+  # φ), which hover() in assets/velcrys.js computes in the browser from meta
+  trace = {k: np.asarray(a, dtype=np.int32 if k in ('i', 'j', 'k') else np.float32) for k, a in arrays.items()}
+  trace['meta'] = meta
+  return trace
+
+
+@timed('figure')
+def tric3d_figure(C,rho,nn,sol,mesh,data):
+
+    if C is None:
+        raise PreventUpdate
     
-    n=int(np.sqrt(nn))
+    nn = plotted(nn)
     
-    aa=complex(0,n)
+    # odd n so that the grid contains the opposite direction -n of every direction n
+    n=2*(int(np.sqrt(nn))//2)+1
     
-    a11=cc11*10**9/rho
-    a12=cc12*10**9/rho
-    a13=cc13*10**9/rho
-    a14=cc14*10**9/rho
-    a15=cc15*10**9/rho
-    a16=cc16*10**9/rho
-    a22=cc22*10**9/rho
-    a23=cc23*10**9/rho
-    a24=cc24*10**9/rho
-    a25=cc25*10**9/rho
-    a26=cc26*10**9/rho
-    a33=cc33*10**9/rho
-    a34=cc34*10**9/rho
-    a35=cc35*10**9/rho
-    a36=cc36*10**9/rho
-    a44=cc44*10**9/rho
-    a45=cc45*10**9/rho
-    a46=cc46*10**9/rho
-    a55=cc55*10**9/rho
-    a56=cc56*10**9/rho
-    a66=cc66*10**9/rho
+    aa=complex(0,n)
     
-    u, v = np.mgrid[0:np.pi:aa, 0:2*np.pi:aa]
-    kkx = np.sin(u)*np.cos(v)
-    kky = np.sin(u)*np.sin(v)
-    kkz = np.cos(u)
+    A = tuple(voigt21(C)*10**9/rho)
     
+    hover = """v = %{customdata[0]:.6g} m/s<br>vx = %{customdata[1]:.6g} m/s<br>vy = %{customdata[2]:.6g} m/s<br>vz = %{customdata[3]:.6g} m/s<br>nx = kx/k = %{customdata[4]:.6g}<br>ny = ky/k = %{customdata[5]:.6g}<br>nz = kz/k = %{customdata[6]:.6g}<br>θ = %{customdata[7]:.6g}°<br>φ = %{customdata[8]:.6g}°<br>"""
     
-    vx0=np.zeros((n,n))
-    vy0=np.zeros((n,n))
-    vz0=np.zeros((n,n))
-    v0=np.zeros((n,n))
+    from plotly.subplots import make_subplots
     
+    fig = make_subplots(rows=1, cols=1,
+                    specs=[[{'is_3d': True}]],
+                    subplot_titles=['  Color corresponds to the magnitude of sound velocity (group velocity) |v|(m/s) '])
     
-    for ii in range(0, n):
-  
-      for jj in range(0, n):
+    if mesh in ('fibonacci', 'adaptive'):
     
-        kx=kkx[ii,jj]
-        ky=kky[ii,jj]
-        kz=kkz[ii,jj]
-        
-        vvx,vvy,vvz = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kx,ky,kz,sol)
+      if mesh == 'adaptive':
+        N, tri, vv = adaptive_sphere(A,nn)
+      else:
+        N, tri = fibonacci_sphere(nn)
+        vv = surface_modes(A,nn,mesh)
+      
+      kkx, kky, kkz = N.T
+      u = np.arccos(kkz)
+      v = np.arctan2(kky,kkx) % (2*np.pi)
+      
+      vx0,vy0,vz0 = vv[SOLS.index(sol)]
+      v0=np.sqrt(vx0**2+vy0**2+vz0**2)
+      
+      if data == 'compact':
+        trace = compact({'hover': 'velocity'}, x=v0*kkx, y=v0*kky, z=v0*kkz, i=tri[:,0], j=tri[:,1], k=tri[:,2], intensity=v0,
+                        customdata=np.stack((vx0,vy0,vz0),axis=-1))
+      else:
+        list0 = np.stack((v0,vx0,vy0,vz0,kkx,kky,kkz,u*(180.0/np.pi),v*(180.0/np.pi)),axis=-1)
+        trace = dict(x=v0*kkx, y=v0*kky, z=v0*kkz, i=tri[:,0], j=tri[:,1], k=tri[:,2], intensity=v0, customdata=list0)
+      
+      fig.add_trace(go.Mesh3d(**trace, name=" ", hoverinfo="name",
+                                 hovertemplate = hover),1, 1)
     
-        vx0[ii,jj]=vvx
-        vy0[ii,jj]=vvy
-        vz0[ii,jj]=vvz
-        v0[ii,jj]=np.sqrt(vx0[ii,jj]**2+vy0[ii,jj]**2+vz0[ii,jj]**2)
+    else:
     
+      u, v = np.mgrid[0:np.pi:aa, 0:2*np.pi:aa]
+      kkx = np.sin(u)*np.cos(v)
+      kky = np.sin(u)*np.sin(v)
+      kkz = np.cos(u)
+      
+      
+      vx0,vy0,vz0 = surface_modes(A,n)[SOLS.index(sol)]
+      v0=np.sqrt(vx0**2+vy0**2+vz0**2)
+      
 
-    x = v0*kkx
-    y = v0*kky
-    z = v0*kkz
-
-
-    list00 = np.stack((np.transpose(x),np.transpose(y),np.transpose(z),np.transpose(v0)),axis=0)
-    list0 = np.stack((v0,vx0,vy0,vz0,kkx,kky,kkz,u*(180.0/np.pi),v*(180.0/np.pi)),axis=-1)
-
+      x = v0*kkx
+      y = v0*kky
+      z = v0*kkz
 
 
-    fig = make_subplots(rows=1, cols=1,
-                    specs=[[{'is_3d': True}]],
-                    subplot_titles=['  Color corresponds to the magnitude of sound velocity (group velocity) |v|(m/s) '])
+      list00 = np.stack((np.transpose(x),np.transpose(y),np.transpose(z),np.transpose(v0)),axis=0)
+      
+      if data == 'compact':
+        trace = compact({'hover': 'velocity'}, x=list00[0], y=list00[1], z=list00[2], surfacecolor=list00[3],
+                        customdata=np.stack((vx0,vy0,vz0),axis=-1))
+      else:
+        list0 = np.stack((v0,vx0,vy0,vz0,kkx,kky,kkz,u*(180.0/np.pi),v*(180.0/np.pi)),axis=-1)
+        trace = dict(x=list00[0], y=list00[1], z=list00[2], surfacecolor=list00[3], customdata=list0)
 
 
-    fig.add_trace(go.Surface(x=list00[0], y=list00[1], z=list00[2], surfacecolor=list00[3], customdata=list0, name=" ", hoverinfo="name",
-                                 hovertemplate = """v = %{customdata[0]:.6g} m/s<br>vx = %{customdata[1]:.6g} m/s<br>vy = %{customdata[2]:.6g} m/s<br>vz = %{customdata[3]:.6g} m/s<br>nx = kx/k = %{customdata[4]:.6g}<br>ny = ky/k = %{customdata[5]:.6g}<br>nz = kz/k = %{customdata[6]:.6g}<br>θ = %{customdata[7]:.6g}°<br>φ = %{customdata[8]:.6g}°<br>"""),1, 1)
+      fig.add_trace(go.Surface(**trace, name=" ", hoverinfo="name",
+                                 hovertemplate = hover),1, 1)
 
 
     fig.update_layout(transition_duration=500)
@@ -1342,332 +1732,209 @@ def update_tric3d(cc11,cc12,cc13,cc14,cc15,cc16,cc22,cc23,cc24,cc25,cc26,cc33,cc
     
     return fig
 
-def vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,n1,n2,n3,sol):
-  
-  g11=a11*n1*n1+2.0*a16*n1*n2+2.0*a15*n1*n3+a66*n2*n2+2.0*a56*n2*n3+a55*n3*n3
-  g12=a16*n1*n1+(a12+a66)*n1*n2+(a14+a56)*n1*n3+a26*n2*n2+(a25+a46)*n2*n3+a45*n3*n3
-  g13=a15*n1*n1+(a14+a56)*n1*n2+(a13+a55)*n1*n3+a46*n2*n2+(a36+a45)*n2*n3+a35*n3*n3
-  g22=a66*n1*n1+2.0*a26*n1*n2+2.0*a46*n1*n3+a22*n2*n2+2.0*a24*n2*n3+a44*n3*n3
-  g23=a56*n1*n1+(a25+a46)*n1*n2+(a36+a45)*n1*n3+a24*n2*n2+(a23+a44)*n2*n3+a34*n3*n3
-  g33=a55*n1*n1+2.0*a45*n1*n2+2.0*a35*n1*n3+a44*n2*n2+2.0*a34*n2*n3+a33*n3*n3
-
-  bb=-(g11+g22+g33)
-  cc=g11*g33+g22*g33+g11*g22-g12**2-g13**2-g23**2
-  dd=g23**2*g11+g13**2*g22+g12**2*g33-g11*g22*g33-2.0*g12*g13*g23
 
+@app.callback(
+    [Output('previewtric3d', 'data'), Output('stagetric3d', 'data')],
+    [Input(component_id='tensortric3d', component_property='data'),
+     Input(component_id='rhotric3d', component_property='value'),
+     Input(component_id='ntric3d', component_property='value'),
+     Input(component_id='soltric3d', component_property='value'),
+     Input(component_id='meshtric3d', component_property='value'),
+     Input(component_id='datatric3d', component_property='value'),
+    ],
+)
 
-#  p=g11+g22+g33
-#  q=g11*g22-g12**2+g22*g33-g23**2+g11*g33-g13**2
-#  detg=g11*(g22*g33-g23**2)-g12*(g12*g33-g23*g13)+g13*(g12*g23-g22*g13)
-#  r=np.sqrt(-(1.0/27.0)*(q-((p**2)/3.0))**3)
 
+def update_tric3d_preview(C,rho,nn,sol,mesh,data):
 
-  dbdn1= -2.0*a11*n1 - 2.0*a15*n3 - 2.0*a16*n2 - 2.0*a26*n2 - 2.0*a35*n3 - 2.0*a45*n2 - 2.0*a46*n3 - 2.0*a55*n1 - 2.0*a66*n1
-  dbdn2= -2.0*a16*n1 - 2.0*a22*n2 - 2.0*a24*n3 - 2.0*a26*n1 - 2.0*a34*n3 - 2.0*a44*n2 - 2.0*a45*n1 - 2.0*a56*n3 - 2.0*a66*n2
-  dbdn3= -2.0*a15*n1 - 2.0*a24*n2 - 2.0*a33*n3 - 2.0*a34*n2 - 2.0*a35*n1 - 2.0*a44*n3 - 2.0*a46*n1 - 2.0*a55*n3 - 2.0*a56*n2
+    if C is None:
+        raise PreventUpdate
+    
+    stage = uuid.uuid4().hex
+    
+    if not preview(nn):
+        return {'stage': stage, 'figure': None}, stage
+    
+    return {'stage': stage, 'figure': tric3d_figure(C,rho,int(nn)//PREVIEW,sol,mesh,data)}, stage
 
 
-  dcdn1= (2*a11*n1 + 2.0*a15*n3 + 2.0*a16*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2*a11*n1 + 2.0*a15*n3 + 2.0*a16*n2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) - (4*a15*n1 + 2*n2*(a14 + a56) + 2*n3*(a13 + a55))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45)) - (4*a16*n1 + 2*n2*(a12 + a66) + 2*n3*(a14 + a56))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46)) + (2.0*a26*n2 + 2.0*a46*n3 + 2*a66*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2.0*a26*n2 + 2.0*a46*n3 + 2*a66*n1)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a35*n3 + 2.0*a45*n2 + 2*a55*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2.0*a35*n3 + 2.0*a45*n2 + 2*a55*n1)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) - (4*a56*n1 + 2*n2*(a25 + a46) + 2*n3*(a36 + a45))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))
+@app.callback(
+    Output('figuretric3d', 'data'),
+    [Input(component_id='stagetric3d', component_property='data')],
+    [State(component_id='tensortric3d', component_property='data'),
+     State(component_id='rhotric3d', component_property='value'),
+     State(component_id='ntric3d', component_property='value'),
+     State(component_id='soltric3d', component_property='value'),
+     State(component_id='meshtric3d', component_property='value'),
+     State(component_id='datatric3d', component_property='value'),
+     State(component_id='session', component_property='data')],
+    **background('tric3d'),
+)
 
-  dcdn2= (2.0*a16*n1 + 2.0*a56*n3 + 2*a66*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2.0*a16*n1 + 2.0*a56*n3 + 2*a66*n2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2*a22*n2 + 2.0*a24*n3 + 2.0*a26*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2*a22*n2 + 2.0*a24*n3 + 2.0*a26*n1)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) - (4*a24*n2 + 2*n1*(a25 + a46) + 2*n3*(a23 + a44))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) - (4*a26*n2 + 2*n1*(a12 + a66) + 2*n3*(a25 + a46))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46)) + (2.0*a34*n3 + 2*a44*n2 + 2.0*a45*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2.0*a34*n3 + 2*a44*n2 + 2.0*a45*n1)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) - (4*a46*n2 + 2*n1*(a14 + a56) + 2*n3*(a36 + a45))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))
 
-  dcdn3= (2.0*a15*n1 + 2*a55*n3 + 2.0*a56*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2.0*a15*n1 + 2*a55*n3 + 2.0*a56*n2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a24*n2 + 2*a44*n3 + 2.0*a46*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2.0*a24*n2 + 2*a44*n3 + 2.0*a46*n1)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2*a33*n3 + 2.0*a34*n2 + 2.0*a35*n1)*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2) + (2*a33*n3 + 2.0*a34*n2 + 2.0*a35*n1)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) - (4*a34*n3 + 2*n1*(a36 + a45) + 2*n2*(a23 + a44))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) - (4*a35*n3 + 2*n1*(a13 + a55) + 2*n2*(a36 + a45))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45)) - (4*a45*n3 + 2*n1*(a14 + a56) + 2*n2*(a25 + a46))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))
+@with_progress
+def update_tric3d(stage,C,rho,nn,sol,mesh,data):
 
-  dddn1= (-2*a11*n1 - 2.0*a15*n3 - 2.0*a16*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2*a11*n1 + 2.0*a15*n3 + 2.0*a16*n2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))**2 + (-2*a15*n1 - n2*(a14 + a56) - n3*(a13 + a55))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4*a15*n1 + 2*n2*(a14 + a56) + 2*n3*(a13 + a55))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (4*a16*n1 + 2*n2*(a12 + a66) + 2*n3*(a14 + a56))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (4.0*a16*n1 + 2.0*n2*(a12 + a66) + 2.0*n3*(a14 + a56))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (2.0*a26*n2 + 2.0*a46*n3 + 2*a66*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a26*n2 + 2.0*a46*n3 + 2*a66*n1)*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))**2 + (2.0*a35*n3 + 2.0*a45*n2 + 2*a55*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2.0*a35*n3 + 2.0*a45*n2 + 2*a55*n1)*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))**2 + (2*a56*n1 + n2*(a25 + a46) + n3*(a36 + a45))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46)) + (4*a56*n1 + 2*n2*(a25 + a46) + 2*n3*(a36 + a45))*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))
+    return {'stage': stage, 'figure': tric3d_figure(C,rho,nn,sol,mesh,data)}
 
-  dddn2= (-2.0*a16*n1 - 2.0*a56*n3 - 2*a66*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a16*n1 + 2.0*a56*n3 + 2*a66*n2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))**2 + (2*a22*n2 + 2.0*a24*n3 + 2.0*a26*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2*a22*n2 + 2.0*a24*n3 + 2.0*a26*n1)*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))**2 + (2*a24*n2 + n1*(a25 + a46) + n3*(a23 + a44))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46)) + (4*a24*n2 + 2*n1*(a25 + a46) + 2*n3*(a23 + a44))*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4.0*a26*n2 + 2.0*n1*(a12 + a66) + 2.0*n3*(a25 + a46))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4*a26*n2 + 2*n1*(a12 + a66) + 2*n3*(a25 + a46))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a34*n3 + 2*a44*n2 + 2.0*a45*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2.0*a34*n3 + 2*a44*n2 + 2.0*a45*n1)*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))**2 + (-2*a46*n2 - n1*(a14 + a56) - n3*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4*a46*n2 + 2*n1*(a14 + a56) + 2*n3*(a36 + a45))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2)
+@app.callback(
+    Output('filetric3d', 'data'),
+    [Input(component_id='savetric3d', component_property='n_clicks'),
+    ],
+    [State(component_id='tensortric3d', component_property='data'),
+     State(component_id='rhotric3d', component_property='value'),
+     State(component_id='ntric3d', component_property='value'),
+     State(component_id='soltric3d', component_property='value'),
+     State(component_id='meshtric3d', component_property='value'),
+    ],
+    prevent_initial_call=True,
+)
 
-  dddn3= (-2.0*a15*n1 - 2*a55*n3 - 2.0*a56*n2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a15*n1 + 2*a55*n3 + 2.0*a56*n2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))**2 + (2.0*a24*n2 + 2*a44*n3 + 2.0*a46*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (2.0*a24*n2 + 2*a44*n3 + 2.0*a46*n1)*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))**2 + (2*a33*n3 + 2.0*a34*n2 + 2.0*a35*n1)*(-a11*n1**2 - 2.0*a15*n1*n3 - 2.0*a16*n1*n2 - a55*n3**2 - 2.0*a56*n2*n3 - a66*n2**2)*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (2*a33*n3 + 2.0*a34*n2 + 2.0*a35*n1)*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))**2 + (2*a34*n3 + n1*(a36 + a45) + n2*(a23 + a44))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46)) + (4*a34*n3 + 2*n1*(a36 + a45) + 2*n2*(a23 + a44))*(a11*n1**2 + 2.0*a15*n1*n3 + 2.0*a16*n1*n2 + a55*n3**2 + 2.0*a56*n2*n3 + a66*n2**2)*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (-2*a35*n3 - n1*(a13 + a55) - n2*(a36 + a45))*(2.0*a16*n1**2 + 2.0*a26*n2**2 + 2.0*a45*n3**2 + 2.0*n1*n2*(a12 + a66) + 2.0*n1*n3*(a14 + a56) + 2.0*n2*n3*(a25 + a46))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44)) + (4*a35*n3 + 2*n1*(a13 + a55) + 2*n2*(a36 + a45))*(a15*n1**2 + a35*n3**2 + a46*n2**2 + n1*n2*(a14 + a56) + n1*n3*(a13 + a55) + n2*n3*(a36 + a45))*(a22*n2**2 + 2.0*a24*n2*n3 + 2.0*a26*n1*n2 + a44*n3**2 + 2.0*a46*n1*n3 + a66*n1**2) + (4*a45*n3 + 2*n1*(a14 + a56) + 2*n2*(a25 + a46))*(a16*n1**2 + a26*n2**2 + a45*n3**2 + n1*n2*(a12 + a66) + n1*n3*(a14 + a56) + n2*n3*(a25 + a46))*(a33*n3**2 + 2.0*a34*n2*n3 + 2.0*a35*n1*n3 + a44*n2**2 + 2.0*a45*n1*n2 + a55*n1**2) + (4.0*a45*n3 + 2.0*n1*(a14 + a56) + 2.0*n2*(a25 + a46))*(-a15*n1**2 - a35*n3**2 - a46*n2**2 - n1*n2*(a14 + a56) - n1*n3*(a13 + a55) - n2*n3*(a36 + a45))*(a24*n2**2 + a34*n3**2 + a56*n1**2 + n1*n2*(a25 + a46) + n1*n3*(a36 + a45) + n2*n3*(a23 + a44))
 
+def save_tric3d(clicks,C,rho,nn,sol,mesh):
 
-  c2 = unaryCubicEquation(bb, cc, dd)
-  
-  c2 = np.array(c2)
-  c4 = c2 * c2
-  pv = np.sqrt(c2)
-  EPS = 10**-7
-
-  if np.abs(pv[1] - pv[2]) < EPS:
-    nRoot = 2
-    if np.abs(pv[0] - pv[2]) < EPS:
-      nRoot = 1
-  else:
-    nRoot = 3
-      
-  if nRoot == 1:
-    g = 6.0 * pv 
-    vx=-dbdn1/g[0]
-    vy=-dbdn2/g[0]
-    vz=-dbdn3/g[0]
-    
-  elif nRoot == 2:
-    g = np.array([2.0 * pv[0] * (3.0 * c4[0] + 2.0 * bb * c2[0] + cc),
-                      4.0 * pv[1] * (3.0 * c2[1] + bb),
-                      4.0 * pv[2] * (3.0 * c2[2] + bb)])
-    if sol == 'sol_1':
-      vx=-(c4[0] * dbdn1 + c2[0] * dcdn1 + dddn1) / g[0]
-      vy=-(c4[0] * dbdn2 + c2[0] * dcdn2 + dddn2) / g[0]
-      vz=-(c4[0] * dbdn3 + c2[0] * dcdn3 + dddn3) / g[0]
-      
-    elif sol == 'sol_2':
-      vx=-(2.0 * c2[1] * dbdn1 + dcdn1) / g[1]
-      vy=-(2.0 * c2[1] * dbdn2 + dcdn2) / g[1]
-      vz=-(2.0 * c2[1] * dbdn3 + dcdn3) / g[1]
+    if C is None:
+        raise PreventUpdate
     
-    elif sol == 'sol_3':
-      vx=-(2.0 * c2[2] * dbdn1 + dcdn1) / g[2]
-      vy=-(2.0 * c2[2] * dbdn2 + dcdn2) / g[2]
-      vz=-(2.0 * c2[2] * dbdn3 + dcdn3) / g[2]
+    C = voigt21(C)*10**9
+    A = tuple(C/rho)
     
-  else:
-    g = 2.0 * pv * (3.0 * c4 + 2.0 * bb * c2 + cc)
-    if sol == 'sol_1':
-      vx=-(c4[0] * dbdn1 + c2[0] * dcdn1 + dddn1) / g[0]
-      vy=-(c4[0] * dbdn2 + c2[0] * dcdn2 + dddn2) / g[0]
-      vz=-(c4[0] * dbdn3 + c2[0] * dcdn3 + dddn3) / g[0]
-      
-    elif sol == 'sol_2':
-      vx=-(c4[1] * dbdn1 + c2[1] * dcdn1 + dddn1) / g[1]
-      vy=-(c4[1] * dbdn2 + c2[1] * dcdn2 + dddn2) / g[1]
-      vz=-(c4[1] * dbdn3 + c2[1] * dcdn3 + dddn3) / g[1]
-    
-    elif sol == 'sol_3':
-      vx=-(c4[2] * dbdn1 + c2[2] * dcdn1 + dddn1) / g[2]
-      vy=-(c4[2] * dbdn2 + c2[2] * dcdn2 + dddn2) / g[2]
-      vz=-(c4[2] * dbdn3 + c2[2] * dcdn3 + dddn3) / g[2]
-  
-  
-  v0x=np.real(vx)
-  v0y=np.real(vy)
-  v0z=np.real(vz)
-     
-  return v0x,v0y,v0z
-
-def unaryCubicEquation(B, C, D):
-    # solve equation x**3 + Bx**2 + Cx + D = 0
-    w = complex(-0.5, cmath.sqrt(0.75))
-    w2 = w * w
-    res = [0, 0, 0]
-    sig = 1
-    P = B * C / 6.0 - B ** 3 / 27.0 - 0.5 * D
-    Q = (3.0 * C - B * B) / 9.0
-    v = cmath.sqrt(P * P + Q ** 3)
-    u = P + v
-    v = P - v
-    if abs(v) > abs(u):
-        u = v
-        sig = -1
-    u = u ** (1.0 / 3.0)
-    if abs(u) > 1.0e-15:
-        v = -Q / u
+    if mesh == 'adaptive':
+      N, tri, vv = adaptive_sphere(A,nn)
+      spec = {'type': mesh, 'n': nn}
+    elif mesh == 'fibonacci':
+      N = None
+      vv = surface_modes(A,nn,mesh)
+      spec = {'type': mesh, 'n': nn}
     else:
-        v = 0.0
-    res[0] = -B / 3.0
-    res[0] += u + v
-    res[1] = -B / 3.0
-    res[1] += u * w + v * w2    
-    res[2] = -B / 3.0
-    res[2] += u * w2 + v * w
-
-    return res
-
-############## cub_field_3D_plot
-
-@app.callback(
-    Output('output_cf', 'figure'),
-    [Input(component_id='c11cf', component_property='value'),
-     Input(component_id='c12cf', component_property='value'),
-     Input(component_id='c44cf', component_property='value'),
-     Input(component_id='mscf', component_property='value'),
-     Input(component_id='k1cf', component_property='value'),
-     Input(component_id='k2cf', component_property='value'),
-     Input(component_id='b1cf', component_property='value'),
-     Input(component_id='b2cf', component_property='value'),
-     Input(component_id='hxcf', component_property='value'),
-     Input(component_id='hycf', component_property='value'),
-     Input(component_id='hzcf', component_property='value'),
-     Input(component_id='rhocf', component_property='value'),
-     Input(component_id='ncf', component_property='value'),
-     Input(component_id='solcf', component_property='value'),
-     Input(component_id='scalecf', component_property='value'),
-    ],
-
-)
-
+      # same odd grid as update_tric3d()
+      N = None
+      n=2*(int(np.sqrt(nn))//2)+1
+      vv = surface_modes(A,n)
+      spec = {'type': mesh, 'n': n}
+    
+    mode = MODES[SOLS.index(sol)]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, 'velcrys-%s.vcs' % mode)
+      save_surface(path, C, rho, spec, mode, vv[SOLS.index(sol)], N=N)
+      return dcc.send_file(path)
 
-def update_cf(cc11,cc12,cc44,ms,kk1,kk2,bb1,bb2,hx,hy,hz,rho,nn,sol,s):
+############## field_3D_plot
 
-    delta=0.0*10.0**(-5)
-    mu0 = 4.0*np.pi*10.0**(-7)
-    ms = ms/mu0
-    k1 = kk1*10.0**6  #J/m^3
-    k2 = kk2*10.0**6  #J/m^3
-    b1 = bb1*10.0**6  # Pa
-    b2 = bb2*10.0**6  # Pa
-  #  dk1 = ((b1**2)/(c11 - c12)) - ((b2**2)/(2.0*c44))
-  #  k1eff = (k1 + dk1)
+def magnetic_change(magnetic):
+  # fractional change (v-v0)/v0 of the solution sol on the plot mesh of a field plot, for the
+  # elastic tensor C and the corrections dCij given by magnetic (magnetic_cubic or magnetic_hex)
+  # for its magnetic constants and the field hx, hy, hz that come between C and rho
+  def change(C, *args):
     
-    hx=hx+delta
-    hy=hy+delta
-    hz=hz+delta
+    *constants, rho, nn, sol, mesh = args
     
-    a = [hx,hy,hz,ms,k1,k2]  
-  
-    x0 = minimize(enecub,np.array([0.2,0.3]),args=(a),method='Nelder-Mead',options={'maxiter': 1000, 'maxfev': 1000, 'disp': True, 'xatol': 0.0000001})
-
-    xx=float(x0.x[0])
-    yy=float(x0.x[1])
-    
-    ett0=ett(xx,yy,hx,hy,hz,ms,k1,k2)
-    epp0=epp(xx,yy,hx,hy,hz,ms,k1,k2)
-    
-    chizz= (ms**2*np.sin(xx)**2)/ett0
-    chiyz= -(ms**2*np.sin(xx)*np.cos(xx)*np.sin(yy))/(ett0)
-    chixz= -(ms**2*np.sin(xx)*np.cos(xx)*np.cos(yy))/(ett0)
-    chiyy= ms**2*(((np.cos(xx)**2*np.sin(yy)**2)/ett0) + ((np.sin(xx)**2*np.cos(yy)**2)/epp0))
-    chixx= ms**2*(((np.cos(xx)**2*np.cos(yy)**2)/ett0) + ((np.sin(xx)**2*np.sin(yy)**2)/epp0))
-    chixy= -ms**2*(((np.cos(xx)**2*np.cos(yy)*np.sin(yy))/ett0) - ((np.sin(xx)**2*np.cos(yy)*np.sin(yy))/epp0))
-    
-    
-    ax= np.sin(xx)*np.cos(yy)
-    ay= np.sin(xx)*np.sin(yy)
-    az= np.cos(xx)
-    
-    dc11= -(b1/ms)**2*(4.0*chixx*ax**2)  #Pa
-    dc12= -(b1/ms)**2*(4.0*chixy*ax*ay)
-    dc22= -(b1/ms)**2*(4.0*chiyy*ay**2)
-    dc33= -(b1/ms)**2*(4.0*chizz*az**2)
-    dc44= -(b2/ms)**2*(chizz*ay**2 + 2.0*chiyz*ay*az + chiyy*az**2)
-    dc55= -(b2/ms)**2*(chixx*az**2 + chizz*ax**2 + 2.0*chixz*ax*az)
-    dc66= -(b2/ms)**2*(chixx*ay**2 + chiyy*ax**2 + 2.0*chixy*ax*ay)
-    dc13= -(b1/ms)**2*(4.0*chixz*ax*az)
-    dc23= -(b1/ms)**2*(4.0*chiyz*ay*az)
-    dc14= -((2.0*b1*b2)/(ms**2))*(chixy*ax*az + chixz*ax*ay)
-    dc15= -((2.0*b1*b2)/(ms**2))*(chixx*ax*az + chixz*ax*ax)
-    dc16= -((2.0*b1*b2)/(ms**2))*(chixx*ax*ay + chixy*ax*ax)
-    dc24= -((2.0*b1*b2)/(ms**2))*(chiyy*ay*az + chiyz*ay*ay)
-    dc25= -((2.0*b1*b2)/(ms**2))*(chixy*ay*az + chiyz*ax*ay)
-    dc26= -((2.0*b1*b2)/(ms**2))*(chixy*ay*ay + chiyy*ax*ay)
-    dc34= -((2.0*b1*b2)/(ms**2))*(chiyz*az*az + chizz*az*ay)
-    dc35= -((2.0*b1*b2)/(ms**2))*(chixz*az*az + chizz*ax*az)
-    dc36= -((2.0*b1*b2)/(ms**2))*(chixz*ay*az + chiyz*ax*az)
-    dc45= -(b2/ms)**2*(chixy*az**2 + chixz*ay*az + chiyz*ax*az + chizz*ax*ay)
-    dc46= -(b2/ms)**2*(chixy*ay*az + chixz*ay*ay + chiyy*ax*az + chiyz*ax*ay)
-    dc56= -(b2/ms)**2*(chixx*ay*az + chixy*ax*az + chixz*ax*ay + chiyz*ax*ax)
-
-    
-    n=int(np.sqrt(nn))
+    if C is None:
+        raise PreventUpdate
     
-    aa=complex(0,n)
+    nn = plotted(nn)
     
-    a11=(cc11*10**9/rho)+(dc11/rho)
-    a12=(cc12*10**9/rho)+(dc12/rho)
-    a13=(cc12*10**9/rho)+(dc13/rho)
-    a14=(0.0*10**9/rho)+(dc14/rho)
-    a15=(0.0*10**9/rho)+(dc15/rho)
-    a16=(0.0*10**9/rho)+(dc16/rho)
-    a22=(cc11*10**9/rho)+(dc22/rho)
-    a23=(cc12*10**9/rho)+(dc23/rho)
-    a24=(0.0*10**9/rho)+(dc24/rho)
-    a25=(0.0*10**9/rho)+(dc25/rho)
-    a26=(0.0*10**9/rho)+(dc26/rho)
-    a33=(cc11*10**9/rho)+(dc33/rho)
-    a34=(0.0*10**9/rho)+(dc34/rho)
-    a35=(0.0*10**9/rho)+(dc35/rho)
-    a36=(0.0*10**9/rho)+(dc36/rho)
-    a44=(cc44*10**9/rho)+(dc44/rho)
-    a45=(0.0*10**9/rho)+(dc45/rho)
-    a46=(0.0*10**9/rho)+(dc46/rho)
-    a55=(cc44*10**9/rho)+(dc55/rho)
-    a56=(0.0*10**9/rho)+(dc56/rho)
-    a66=(cc44*10**9/rho)+(dc66/rho)
+    dc = magnetic(*constants)[0]
     
-    a011=cc11*10**9/rho
-    a012=cc12*10**9/rho
-    a013=cc12*10**9/rho
-    a014=0.0*10**9/rho
-    a015=0.0*10**9/rho
-    a016=0.0*10**9/rho
-    a022=cc11*10**9/rho
-    a023=cc12*10**9/rho
-    a024=0.0*10**9/rho
-    a025=0.0*10**9/rho
-    a026=0.0*10**9/rho
-    a033=cc11*10**9/rho
-    a034=0.0*10**9/rho
-    a035=0.0*10**9/rho
-    a036=0.0*10**9/rho
-    a044=cc44*10**9/rho
-    a045=0.0*10**9/rho
-    a046=0.0*10**9/rho
-    a055=cc44*10**9/rho
-    a056=0.0*10**9/rho
-    a066=cc44*10**9/rho
+    # odd n so that the grid contains the opposite direction -n of every direction n
+    n=2*(int(np.sqrt(nn))//2)+1
     
-    u, v = np.mgrid[0:np.pi:aa, 0:2*np.pi:aa]
-    kkx = np.sin(u)*np.cos(v)
-    kky = np.sin(u)*np.sin(v)
-    kkz = np.cos(u)
+    A0 = voigt21(C)*10**9/rho
+    A = A0 + voigt21(dc)/rho
     
+    if mesh == 'fibonacci':
+      n=nn
     
-    vx0=np.zeros((n,n))
-    vy0=np.zeros((n,n))
-    vz0=np.zeros((n,n))
-    v0=np.zeros((n,n))
+    return fractional_change(tuple(A),tuple(A0),n,mesh)[SOLS.index(sol)]
+  
+  return change
+
+def field_plot(mode, change, constants):
+  # callbacks of the field plot of a mode ('cf' or 'hf'), whose inputs are the tensor, the magnetic
+  # constants, the field, rho, N, the solution and the mesh: the preview and the new stage, the
+  # full fractional change change() of the stage (see background() and with_progress()) and the
+  # figure of the latest of both (see kept() and staged()). Named update_<mode>_preview,
+  # update_<mode> and update_<mode>_figure for the metrics and the profiles
+  ids = ['tensor'] + constants + ['hx', 'hy', 'hz', 'rho', 'n', 'sol', 'mesh']
+  props = ['data'] + ['value']*(len(ids)-1)
+  
+  def update_preview(*args):
     
-    vx00=np.zeros((n,n))
-    vy00=np.zeros((n,n))
-    vz00=np.zeros((n,n))
-    v00=np.zeros((n,n))
+    C, nn = args[0], args[-3]
     
-    v000=np.zeros((n,n))
+    if C is None:
+        raise PreventUpdate
     
+    stage = uuid.uuid4().hex
     
+    if not preview(nn):
+        return {'stage': stage, 'key': None}, stage
     
-    for ii in range(0, n):
+    return kept(stage, change, [*args[:-3], int(nn)//PREVIEW, *args[-2:]]), stage
   
-      for jj in range(0, n):
+  def update(stage, *args):
     
-        kx=kkx[ii,jj]
-        ky=kky[ii,jj]
-        kz=kkz[ii,jj]
-        
-        vvx,vvy,vvz = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kx,ky,kz,sol)
-        
-        vvvx,vvvy,vvvz = vel(a011,a012,a013,a014,a015,a016,a022,a023,a024,a025,a026,a033,a034,a035,a036,a044,a045,a046,a055,a056,a066,kx,ky,kz,sol)
+    return kept(stage, change, list(args))
+  
+  @timed('figure')
+  def update_figure(preview,full,s,data):
     
-        vx0[ii,jj]=vvx
-        vy0[ii,jj]=vvy
-        vz0[ii,jj]=vvz
-        v0[ii,jj]=np.sqrt(vx0[ii,jj]**2+vy0[ii,jj]**2+vz0[ii,jj]**2)
-        
-        vx00[ii,jj]=vvvx
-        vy00[ii,jj]=vvvy
-        vz00[ii,jj]=vvvz
-        v00[ii,jj]=np.sqrt(vx00[ii,jj]**2+vy00[ii,jj]**2+vz00[ii,jj]**2)
-        
-        v000[ii,jj]=(v0[ii,jj]-v00[ii,jj])/v00[ii,jj]
+    v000=np.asarray(staged(preview,full),dtype=float)
+  
+    hover = """(v-v0)/v0 = %{customdata[0]:.6g}<br>nx = kx/k = %{customdata[1]:.6g}<br>ny = ky/k = %{customdata[2]:.6g}<br>nz = kz/k = %{customdata[3]:.6g}<br>θ = %{customdata[4]:.6g}°<br>φ = %{customdata[5]:.6g}°<br>"""
+  
+    from plotly.subplots import make_subplots
+  
+    fig = make_subplots(rows=1, cols=1,
+                    specs=[[{'is_3d': True}]],
+                    subplot_titles=['  Color corresponds to the magnitude of fractional change in sound velocity (group velocity) (v-v0)/v0 '])
+  
+    if v000.ndim == 1:
+  
+      # Fibonacci lattice (see mesh_directions())
+      N, tri = fibonacci_sphere(len(v000))
+      kkx, kky, kkz = N.T
+      u = np.arccos(kkz)
+      v = np.arctan2(kky,kkx) % (2*np.pi)
+    
+      if data == 'compact':
+        trace = compact({'hover': 'change', 'scale': s}, x=(1.0+s*v000)*kkx, y=(1.0+s*v000)*kky, z=(1.0+s*v000)*kkz, i=tri[:,0], j=tri[:,1], k=tri[:,2], intensity=v000)
+      else:
+        list0 = np.stack((v000,kkx,kky,kkz,u*(180.0/np.pi),v*(180.0/np.pi)),axis=-1)
+        trace = dict(x=(1.0+s*v000)*kkx, y=(1.0+s*v000)*kky, z=(1.0+s*v000)*kkz, i=tri[:,0], j=tri[:,1], k=tri[:,2], intensity=v000, customdata=list0)
+    
+      fig.add_trace(go.Mesh3d(**trace, name=" ", hoverinfo="name",
+                                 hovertemplate = hover),1, 1)
+  
+    else:
+  
+      n=v000.shape[0]
     
-
+      aa=complex(0,n)
     
+      u, v = np.mgrid[0:np.pi:aa, 0:2*np.pi:aa]
+      kkx = np.sin(u)*np.cos(v)
+      kky = np.sin(u)*np.sin(v)
+      kkz = np.cos(u)
     
-    x = (1.0+s*v000)*kkx
-    y = (1.0+s*v000)*kky
-    z = (1.0+s*v000)*kkz
-
-
-    list00 = np.stack((np.transpose(x),np.transpose(y),np.transpose(z),np.transpose(v000)),axis=0)
-    list0 = np.stack((v000,kkx,kky,kkz,u*(180.0/np.pi),v*(180.0/np.pi)),axis=-1)
-
+    
+      x = (1.0+s*v000)*kkx
+      y = (1.0+s*v000)*kky
+      z = (1.0+s*v000)*kkz
 
 
-    fig = make_subplots(rows=1, cols=1,
-                    specs=[[{'is_3d': True}]],
-                    subplot_titles=['  Color corresponds to the magnitude of fractional change in sound velocity (group velocity) (v-v0)/v0 '])
+      list00 = np.stack((np.transpose(x),np.transpose(y),np.transpose(z),np.transpose(v000)),axis=0)
+    
+      if data == 'compact':
+        trace = compact({'hover': 'change', 'scale': s}, x=list00[0], y=list00[1], z=list00[2], surfacecolor=list00[3])
+      else:
+        list0 = np.stack((v000,kkx,kky,kkz,u*(180.0/np.pi),v*(180.0/np.pi)),axis=-1)
+        trace = dict(x=list00[0], y=list00[1], z=list00[2], surfacecolor=list00[3], customdata=list0)
 
 
-    fig.add_trace(go.Surface(x=list00[0], y=list00[1], z=list00[2], surfacecolor=list00[3], customdata=list0, name=" ", hoverinfo="name",
-                                 hovertemplate = """(v-v0)/v0 = %{customdata[0]:.6g}<br>nx = kx/k = %{customdata[1]:.6g}<br>ny = ky/k = %{customdata[2]:.6g}<br>nz = kz/k = %{customdata[3]:.6g}<br>θ = %{customdata[4]:.6g}°<br>φ = %{customdata[5]:.6g}°<br>"""),1, 1)
+      fig.add_trace(go.Surface(**trace, name=" ", hoverinfo="name",
+                                 hovertemplate = hover),1, 1)
 
 
     fig.update_layout(transition_duration=500)
@@ -1678,7 +1945,7 @@ def update_cf(cc11,cc12,cc44,ms,kk1,kk2,bb1,bb2,hx,hy,hz,rho,nn,sol,s):
             "yaxis": {"showticklabels": False},
             "zaxis": {"showticklabels": False}
         })
-        
+      
     fig.update_layout(
         scene = {
             "xaxis": {"title": "nx"},
@@ -1686,240 +1953,48 @@ def update_cf(cc11,cc12,cc44,ms,kk1,kk2,bb1,bb2,hx,hy,hz,rho,nn,sol,s):
             "zaxis": {"title": "nz"}
         })
     
-
-    
-  #  stat = 'The figure has been generated successfully!'
-    
     return fig
-
-
-
-############## hex_field_3D_plot
-
-@app.callback(
-    Output('output_hf', 'figure'),
-    [Input(component_id='c11hf', component_property='value'),
-     Input(component_id='c12hf', component_property='value'),
-     Input(component_id='c13hf', component_property='value'),
-     Input(component_id='c33hf', component_property='value'),
-     Input(component_id='c44hf', component_property='value'),
-     Input(component_id='mshf', component_property='value'),
-     Input(component_id='k1hf', component_property='value'),
-     Input(component_id='k2hf', component_property='value'),
-     Input(component_id='b21hf', component_property='value'),
-     Input(component_id='b22hf', component_property='value'),
-     Input(component_id='b3hf', component_property='value'),
-     Input(component_id='b4hf', component_property='value'),
-     Input(component_id='hxhf', component_property='value'),
-     Input(component_id='hyhf', component_property='value'),
-     Input(component_id='hzhf', component_property='value'),
-     Input(component_id='rhohf', component_property='value'),
-     Input(component_id='nhf', component_property='value'),
-     Input(component_id='solhf', component_property='value'),
-     Input(component_id='scalehf', component_property='value'),
-    ],
-
-)
-
-
-def update_hf(cc11,cc12,cc13,cc33,cc44,ms,kk1,kk2,bb21,bb22,bb3,bb4,hx,hy,hz,rho,nn,sol,s):
-
-    delta=0.0*10.0**(-5)
-    mu0 = 4.0*np.pi*10.0**(-7)
-    ms = ms/mu0
-    k1 = kk1*10.0**6  #J/m^3
-    k2 = kk2*10.0**6  #J/m^3
-    b21 = bb21*10.0**6  # Pa
-    b22 = bb22*10.0**6  # Pa
-    b3 = bb3*10.0**6  # Pa
-    b4 = bb4*10.0**6  # Pa
-    
-    hx=hx+delta
-    hy=hy+delta
-    hz=hz+delta
-    
-    a = [hx,hy,hz,ms,k1,k2]  
   
-    x0 = minimize(enehex,np.array([0.2,0.3]),args=(a),method='Nelder-Mead',options={'maxiter': 1000, 'maxfev': 1000, 'disp': True, 'xatol': 0.0000001})
-
-    xx=float(x0.x[0])
-    yy=float(x0.x[1])
-    
-    ett0=etth(xx,yy,hx,hy,hz,ms,k1,k2)
-    epp0=epph(xx,yy,hx,hy,hz,ms,k1,k2)
-    
-    chizz= (ms**2*np.sin(xx)**2)/ett0
-    chiyz= -(ms**2*np.sin(xx)*np.cos(xx)*np.sin(yy))/(ett0)
-    chixz= -(ms**2*np.sin(xx)*np.cos(xx)*np.cos(yy))/(ett0)
-    chiyy= ms**2*(((np.cos(xx)**2*np.sin(yy)**2)/ett0) + ((np.sin(xx)**2*np.cos(yy)**2)/epp0))
-    chixx= ms**2*(((np.cos(xx)**2*np.cos(yy)**2)/ett0) + ((np.sin(xx)**2*np.sin(yy)**2)/epp0))
-    chixy= -ms**2*(((np.cos(xx)**2*np.cos(yy)*np.sin(yy))/ett0) - ((np.sin(xx)**2*np.cos(yy)*np.sin(yy))/epp0))
-    
-    
-    ax= np.sin(xx)*np.cos(yy)
-    ay= np.sin(xx)*np.sin(yy)
-    az= np.cos(xx)
-    
-    dc11= (1.0/ms)**2*(-b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)+2.0*b21*b3*az*(chiyz*ay-chixz*ax)-chizz*4.0*b21**2*az**2)  #Pa
-    dc22= (1.0/ms)**2*(-b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)-2.0*b21*b3*az*(chiyz*ay-chixz*ax)-chizz*4.0*b21**2*az**2) 
-    dc33= -(b22/ms)**2*(4.0*chizz*az**2)
-    dc44= -(b4/ms)**2*(chizz*ay**2 + chiyz*ay*az + chiyy*az**2)
-    dc55= -(b4/ms)**2*(chixx*az**2 + chizz*ax**2 + chixz*ax*az)
-    dc66= -(b3/ms)**2*(chixx*ay**2 + chiyy*ax**2 + chixy*ax*ay)
-    dc12= (1.0/ms)**2*(b3**2*(chixx*ax**2+chiyy*ay**2-chixy*ax*ay)-4.0*b21**2*az**2*chizz)
-    dc13= (1.0/ms)**2*(-b22*b3*(chixz*ax*az-chiyz*ay*az)-4.0*chizz*b21*b22*az**2)
-    dc14= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chiyy*ay*az+chixy*ax*az+chixz*ax*ay-chiyz*ay**2)+b21*(4.0*chizz*ay*az+2.0*chiyz*az**2))
-    dc15= -(1.0/ms)**2*(0.5*b4)*(b3*(2.0*chixx*ax*az-chixy*ay*az-chiyz*ax*ay+chixz*ax**2)+b21*(4.0*chizz*ax*az+2.0*chixz*az**2))
-    dc16= -(1.0/ms)**2*(0.5*b3)*(2.0*b3*ax*ay*(chixx-chiyy)+b3*chixy*(ax**2-ay**2)+2.0*b21*az*(ay*chixz+ax*chiyz))
-    dc23= (1.0/ms)**2*(b3*b22*az*(ax*chixz-ay*chiyz)-4.0*b21*b22*az**2*chizz)
-    dc24= -(1.0/ms)**2*(0.5*b4)*(b3*(2.0*chiyy*ay*az-chixy*ax*az-chixz*ax*ay+chiyz*ay**2)+b21*(4.0*chizz*ay*az+2.0*chiyz*az**2))
-    dc25= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chixx*ax*az+chixy*ay*az-chixz*ax**2+chiyz*ax*ay)+b21*(4.0*chizz*ax*az+2.0*chixz*az**2))
-    dc26= -(1.0/ms)**2*(0.5*b4)*(b3*(-2.0*chixx*ay*ax+2.0*chiyy*ax*ay+chixy*ay*ay-chixy*ax**2)+b21*(2.0*chixz*ay*az+2.0*chiyz*az*ax))
-    dc34= -((b22*b4)/(ms**2))*az*(2.0*chizz*ay + az*chiyz)
-    dc35= -((b22*b4)/(ms**2))*az*(2.0*chizz*ax + az*chixz)
-    dc36= -((b22*b3)/(ms**2))*az*(chixz*ay + ax*chiyz)
-    dc45= -0.5*(b4/ms)**2*(chixy*az**2 + chixz*ay*az + chiyz*ax*az + 2.0*chizz*ax*ay)
-    dc46= -0.5*(1.0/ms)**2*b3*b4*(chixy*ay*az + chixz*ay*ay + 2.0*chiyy*ax*az + chiyz*ax*ay)
-    dc56= -0.5*(1.0/ms)**2*b3*b4*(2.0*chixx*ay*az + chixy*ax*az + chixz*ax*ay + chiyz*ax*ax)
-
-    
-    n=int(np.sqrt(nn))
-    
-    aa=complex(0,n)
-    
-    a11=(cc11*10**9/rho)+(dc11/rho)
-    a12=(cc12*10**9/rho)+(dc12/rho)
-    a13=(cc13*10**9/rho)+(dc13/rho)
-    a14=(0.0*10**9/rho)+(dc14/rho)
-    a15=(0.0*10**9/rho)+(dc15/rho)
-    a16=(0.0*10**9/rho)+(dc16/rho)
-    a22=(cc11*10**9/rho)+(dc22/rho)
-    a23=(cc13*10**9/rho)+(dc23/rho)
-    a24=(0.0*10**9/rho)+(dc24/rho)
-    a25=(0.0*10**9/rho)+(dc25/rho)
-    a26=(0.0*10**9/rho)+(dc26/rho)
-    a33=(cc33*10**9/rho)+(dc33/rho)
-    a34=(0.0*10**9/rho)+(dc34/rho)
-    a35=(0.0*10**9/rho)+(dc35/rho)
-    a36=(0.0*10**9/rho)+(dc36/rho)
-    a44=(cc44*10**9/rho)+(dc44/rho)
-    a45=(0.0*10**9/rho)+(dc45/rho)
-    a46=(0.0*10**9/rho)+(dc46/rho)
-    a55=(cc44*10**9/rho)+(dc55/rho)
-    a56=(0.0*10**9/rho)+(dc56/rho)
-    a66=(0.5*(cc11-cc12)*10**9/rho)+(dc66/rho)
-    
-    a011=(cc11*10**9/rho)
-    a012=(cc12*10**9/rho)
-    a013=(cc13*10**9/rho)
-    a014=(0.0*10**9/rho)
-    a015=(0.0*10**9/rho)
-    a016=(0.0*10**9/rho)
-    a022=(cc11*10**9/rho)
-    a023=(cc13*10**9/rho)
-    a024=(0.0*10**9/rho)
-    a025=(0.0*10**9/rho)
-    a026=(0.0*10**9/rho)
-    a033=(cc33*10**9/rho)
-    a034=(0.0*10**9/rho)
-    a035=(0.0*10**9/rho)
-    a036=(0.0*10**9/rho)
-    a044=(cc44*10**9/rho)
-    a045=(0.0*10**9/rho)
-    a046=(0.0*10**9/rho)
-    a055=(cc44*10**9/rho)
-    a056=(0.0*10**9/rho)
-    a066=(0.5*(cc11-cc12)*10**9/rho)
-    
-    u, v = np.mgrid[0:np.pi:aa, 0:2*np.pi:aa]
-    kkx = np.sin(u)*np.cos(v)
-    kky = np.sin(u)*np.sin(v)
-    kkz = np.cos(u)
-    
-    
-    vx0=np.zeros((n,n))
-    vy0=np.zeros((n,n))
-    vz0=np.zeros((n,n))
-    v0=np.zeros((n,n))
-    
-    vx00=np.zeros((n,n))
-    vy00=np.zeros((n,n))
-    vz00=np.zeros((n,n))
-    v00=np.zeros((n,n))
-    
-    v000=np.zeros((n,n))
-    
-    
-    
-    for ii in range(0, n):
+  for func, name in ((update_preview, 'update_%s_preview'), (update, 'update_%s'), (update_figure, 'update_%s_figure')):
+    func.__name__ = func.__qualname__ = name % mode
   
-      for jj in range(0, n):
-    
-        kx=kkx[ii,jj]
-        ky=kky[ii,jj]
-        kz=kkz[ii,jj]
-        
-        vvx,vvy,vvz = vel(a11,a12,a13,a14,a15,a16,a22,a23,a24,a25,a26,a33,a34,a35,a36,a44,a45,a46,a55,a56,a66,kx,ky,kz,sol)
-        
-        vvvx,vvvy,vvvz = vel(a011,a012,a013,a014,a015,a016,a022,a023,a024,a025,a026,a033,a034,a035,a036,a044,a045,a046,a055,a056,a066,kx,ky,kz,sol)
-    
-        vx0[ii,jj]=vvx
-        vy0[ii,jj]=vvy
-        vz0[ii,jj]=vvz
-        v0[ii,jj]=np.sqrt(vx0[ii,jj]**2+vy0[ii,jj]**2+vz0[ii,jj]**2)
-        
-        vx00[ii,jj]=vvvx
-        vy00[ii,jj]=vvvy
-        vz00[ii,jj]=vvvz
-        v00[ii,jj]=np.sqrt(vx00[ii,jj]**2+vy00[ii,jj]**2+vz00[ii,jj]**2)
-        
-        v000[ii,jj]=(v0[ii,jj]-v00[ii,jj])/v00[ii,jj]
-    
-
-    
-    
-    x = (1.0+s*v000)*kkx
-    y = (1.0+s*v000)*kky
-    z = (1.0+s*v000)*kkz
-
-
-    list00 = np.stack((np.transpose(x),np.transpose(y),np.transpose(z),np.transpose(v000)),axis=0)
-    list0 = np.stack((v000,kkx,kky,kkz,u*(180.0/np.pi),v*(180.0/np.pi)),axis=-1)
-
-
-
-    fig = make_subplots(rows=1, cols=1,
-                    specs=[[{'is_3d': True}]],
-                    subplot_titles=['  Color corresponds to the magnitude of fractional change in sound velocity (group velocity) (v-v0)/v0 '])
+  app.callback(
+      [Output('preview'+mode, 'data'), Output('stage'+mode, 'data')],
+      [Input(component_id=i+mode, component_property=p) for i, p in zip(ids, props)],
+  )(update_preview)
+  
+  app.callback(
+      Output('v000'+mode, 'data'),
+      [Input(component_id='stage'+mode, component_property='data')],
+      [State(component_id=i+mode, component_property=p) for i, p in zip(ids, props)] +
+      [State(component_id='session', component_property='data')],
+      **background(mode),
+  )(with_progress(update))
+  
+  app.callback(
+      Output('figure'+mode, 'data'),
+      [Input(component_id='preview'+mode, component_property='data'),
+       Input(component_id='v000'+mode, component_property='data'),
+       Input(component_id='scale'+mode, component_property='value'),
+       Input(component_id='data'+mode, component_property='value'),
+      ],
+  )(update_figure)
+  
+  return update_preview, update, update_figure
 
+############## cub_field_3D_plot
 
-    fig.add_trace(go.Surface(x=list00[0], y=list00[1], z=list00[2], surfacecolor=list00[3], customdata=list0, name=" ", hoverinfo="name",
-                                 hovertemplate = """(v-v0)/v0 = %{customdata[0]:.6g}<br>nx = kx/k = %{customdata[1]:.6g}<br>ny = ky/k = %{customdata[2]:.6g}<br>nz = kz/k = %{customdata[3]:.6g}<br>θ = %{customdata[4]:.6g}°<br>φ = %{customdata[5]:.6g}°<br>"""),1, 1)
+cf_change = magnetic_change(magnetic_cubic)
 
+update_cf_preview, update_cf, update_cf_figure = field_plot('cf', cf_change, ['ms', 'k1', 'k2', 'b1', 'b2'])
 
-    fig.update_layout(transition_duration=500)
+############## hex_field_3D_plot
 
-    fig.update_layout(
-        scene = {
-            "xaxis": {"showticklabels": False},
-            "yaxis": {"showticklabels": False},
-            "zaxis": {"showticklabels": False}
-        })
-        
-    fig.update_layout(
-        scene = {
-            "xaxis": {"title": "nx"},
-            "yaxis": {"title": "ny"},
-            "zaxis": {"title": "nz"}
-        })
-    
+hf_change = magnetic_change(magnetic_hex)
 
-    
-  #  stat = 'The figure has been generated successfully!'
-    
-    return fig
+update_hf_preview, update_hf, update_hf_figure = field_plot('hf', hf_change, ['ms', 'k1', 'k2', 'b21', 'b22', 'b3', 'b4'])
 
 
 
 if __name__ == '__main__':
-        app.run_server(debug=True)
+        app.run(debug=True)